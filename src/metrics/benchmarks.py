@@ -0,0 +1,116 @@
+# ========================================================================
+# GameForge Metrics Microbenchmarks
+# Hot-path instrumentation cost, run with: python benchmarks.py [name ...]
+# ========================================================================
+
+import sys
+import threading
+import time
+
+from prometheus_client import Counter
+
+from gameforge_metrics import FakeGpuBackend, ShardedCounter, metrics
+
+THREAD_COUNTS = [1, 2, 4, 8, 16, 32]
+
+def _run_threads(thread_count, ops_per_thread, target):
+    """Run target(ops) on thread_count threads started together, return seconds"""
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker():
+        barrier.wait()
+        target(ops_per_thread)
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+def bench_sharded_counter(ops_per_thread=200_000):
+    """Compare prometheus_client Counter with ShardedCounter across 1-32 threads"""
+    labels = ('GET', '/api/v1/generate', '200')
+    print(f"{'threads':>8} {'prometheus ops/s':>18} {'sharded ops/s':>16} {'speedup':>8}")
+    for thread_count in THREAD_COUNTS:
+        locked = Counter('bench_locked_total', 'bench', ['method', 'endpoint', 'status'], registry=None)
+        sharded = ShardedCounter('bench_sharded_total', 'bench', ['method', 'endpoint', 'status'], registry=None)
+        locked_child = locked.labels(*labels)
+
+        def locked_target(ops):
+            inc = locked_child.inc
+            for _ in range(ops):
+                inc()
+
+        def sharded_target(ops):
+            inc_key = sharded.inc_key
+            for _ in range(ops):
+                inc_key(labels)
+
+        total_ops = thread_count * ops_per_thread
+        locked_rate = total_ops / _run_threads(thread_count, ops_per_thread, locked_target)
+        sharded_rate = total_ops / _run_threads(thread_count, ops_per_thread, sharded_target)
+
+        merged = sharded.collect()[0].samples[0].value
+        assert merged == total_ops, f'lost increments: {merged} != {total_ops}'
+        print(f'{thread_count:>8} {locked_rate:>18,.0f} {sharded_rate:>16,.0f} {sharded_rate / locked_rate:>7.2f}x')
+
+def _per_call_ns(func, calls):
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter_ns() - start) / calls
+
+def bench_decorator_overhead(calls=500_000):
+    """Per-call cost of time_inference / time_model_load over an undecorated call"""
+    def noop():
+        return None
+
+    variants = [
+        ('undecorated', noop),
+        ('time_inference', metrics.time_inference('bench-model')(noop)),
+        ('time_model_load', metrics.time_model_load('bench-model')(noop)),
+    ]
+    baseline = None
+    print(f"{'variant':>16} {'ns/call':>10} {'overhead ns':>12}")
+    for name, func in variants:
+        per_call = min(_per_call_ns(func, calls) for _ in range(3))
+        if baseline is None:
+            baseline = per_call
+        print(f'{name:>16} {per_call:>10.1f} {per_call - baseline:>12.1f}')
+
+GPU_COUNTS = [1, 2, 4, 8, 16]
+
+def bench_gpu_collection(cycles=2_000):
+    """Cost of one GPU collection cycle with 1-16 simulated GPUs"""
+    previous = metrics.gpu_backend
+    print(f"{'gpus':>6} {'read us':>10} {'cycle us':>12} {'per gpu us':>11}")
+    try:
+        for count in GPU_COUNTS:
+            metrics.set_gpu_backend(FakeGpuBackend(count))
+            start = time.perf_counter_ns()
+            for _ in range(cycles):
+                metrics._read_gpus()
+            read_us = (time.perf_counter_ns() - start) / cycles / 1e3
+            start = time.perf_counter_ns()
+            for _ in range(cycles):
+                metrics.gpu_snapshot(max_age=0)
+                metrics._collect_gpu_metrics()
+            collect_us = (time.perf_counter_ns() - start) / cycles / 1e3
+            print(f'{count:>6} {read_us:>10.1f} {collect_us:>12.1f} {collect_us / count:>11.1f}')
+    finally:
+        metrics.set_gpu_backend(previous)
+
+BENCHMARKS = {
+    'sharded_counter': bench_sharded_counter,
+    'decorator_overhead': bench_decorator_overhead,
+    'gpu_collection': bench_gpu_collection,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f'== {name}')
+        BENCHMARKS[name]()
@@ -3,10 +3,37 @@
 # Prometheus metrics endpoints for custom services
 # ========================================================================
 
+import abc
+import bisect
+import contextvars
+import fcntl
+import glob
+import gzip
+import inspect
+import json
+import math
+import os
+import platform
+import random
+import re
+import struct
+import subprocess
+import tempfile
 import time
+import zlib
 import psutil
-from prometheus_client import Counter, Histogram, Gauge, Info, generate_latest
+from prometheus_client import (
+    Counter, Histogram, Gauge, Info, REGISTRY, CollectorRegistry, multiprocess
+)
+from prometheus_client.core import (
+    CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily, SummaryMetricFamily
+)
+from prometheus_client.exposition import choose_encoder
+from prometheus_client.samples import BucketSpan, Exemplar, NativeHistogram
+from prometheus_client.utils import floatToGoString
 import threading
+from multiprocessing import shared_memory
+from collections import OrderedDict, deque, namedtuple
 from functools import wraps
 
 # Optional NVIDIA GPU monitoring
@@ -17,25 +44,2523 @@ except ImportError:
     nvml = None
     NVIDIA_AVAILABLE = False
 
+# Optional zstd compression for /metrics (stdlib on 3.14+, zstandard before)
+try:
+    from compression import zstd
+    _zstd_compress = zstd.compress
+except ImportError:
+    try:
+        import zstandard
+        _zstd_compress = zstandard.ZstdCompressor(level=3).compress
+    except ImportError:
+        _zstd_compress = None
+
+# Supported Content-Encodings in order of preference
+COMPRESSORS = {}
+if _zstd_compress is not None:
+    COMPRESSORS['zstd'] = _zstd_compress
+COMPRESSORS['gzip'] = lambda body: gzip.compress(body, compresslevel=6)
+COMPRESSORS['identity'] = lambda body: body
+
+# Multiprocess mode for pre-fork worker pools: PROMETHEUS_MULTIPROC_DIR must be
+# set in the environment before any worker imports prometheus_client
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.environ.get('prometheus_multiproc_dir'))
+MULTIPROCESS = bool(MULTIPROC_DIR)
+
+# Minimum interval between two renders of the /metrics exposition
+METRICS_CACHE_TTL = float(os.environ.get('GAMEFORGE_METRICS_CACHE_TTL', '1.0'))
+
+# Backend for hot-path counters: 'sharded' (per-thread shards) or 'prometheus'
+COUNTER_BACKEND = os.environ.get('GAMEFORGE_METRICS_COUNTER_BACKEND', 'sharded')
+
+class _ShardedCounterChild:
+    """Label-bound view of a ShardedCounter"""
+    
+    __slots__ = ('_counter', '_key')
+    
+    def __init__(self, counter, key):
+        self._counter = counter
+        self._key = key
+    
+    def inc(self, amount=1, exemplar=None):
+        self._counter.inc_key(self._key, amount, exemplar)
+
+class ShardedCounter:
+    """Counter whose increments land in per-thread shards merged at collect time
+    
+    Each thread owns a plain dict that only it writes to, so the increment
+    path takes no lock. Shards of finished threads are folded into a retired
+    total on the next collect.
+    """
+    
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self._name = name
+        self._documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()  # guards shard registration and merging
+        self._shards = []  # (thread, shard)
+        self._retired = {}
+        self._exemplars = {}  # key -> latest Exemplar
+        if registry is not None:
+            registry.register(self)
+    
+    def _new_shard(self):
+        shard = {}
+        self._local.shard = shard
+        with self._lock:
+            self._shards.append((threading.current_thread(), shard))
+        return shard
+    
+    def inc_key(self, key, amount=1, exemplar=None):
+        """Increment the series for a tuple of string label values"""
+        if amount < 0:
+            raise ValueError('Counters can only be incremented by non-negative amounts.')
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        shard[key] = shard.get(key, 0) + amount
+        if exemplar is not None:
+            self._exemplars[key] = Exemplar(exemplar, amount, time.time())
+    
+    def labels(self, *labelvalues, **labelkwargs):
+        if labelkwargs:
+            if labelvalues or sorted(labelkwargs) != sorted(self._labelnames):
+                raise ValueError('Incorrect label names')
+            labelvalues = tuple(labelkwargs[name] for name in self._labelnames)
+        if len(labelvalues) != len(self._labelnames):
+            raise ValueError('Incorrect label count')
+        return _ShardedCounterChild(self, tuple(str(v) for v in labelvalues))
+    
+    def inc(self, amount=1, exemplar=None):
+        if self._labelnames:
+            raise ValueError('No label names were set when constructing %s' % self._name)
+        self.inc_key((), amount, exemplar)
+    
+    def _merged(self):
+        with self._lock:
+            totals = dict(self._retired)
+            live = []
+            for thread, shard in self._shards:
+                # dict() copies under the GIL, so a concurrent owner write is
+                # either fully in this scrape or deferred to the next one
+                values = dict(shard)
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    for key, value in values.items():
+                        self._retired[key] = self._retired.get(key, 0) + value
+                for key, value in values.items():
+                    totals[key] = totals.get(key, 0) + value
+            self._shards = live
+        return totals
+    
+    def describe(self):
+        return [CounterMetricFamily(self._name, self._documentation, labels=self._labelnames)]
+    
+    def collect(self):
+        family = CounterMetricFamily(self._name, self._documentation, labels=self._labelnames)
+        exemplars = self._exemplars
+        for key, value in sorted(self._merged().items()):
+            family.add_metric(key, value, exemplar=exemplars.get(key))
+        return [family]
+
+# Maximum resolved label children cached per metric
+LABEL_CACHE_SIZE = int(os.environ.get('GAMEFORGE_METRICS_LABEL_CACHE_SIZE', '1024'))
+
+# Cardinality guard: each guarded metric may create at most this many series;
+# label sets past the cap land in an OVERFLOW_LABEL_VALUE series instead
+MAX_SERIES_PER_METRIC = int(os.environ.get('GAMEFORGE_METRICS_MAX_SERIES', '1000'))
+OVERFLOW_LABEL_VALUE = '__other__'
+
+# Metric attribute -> the unbounded label replaced by OVERFLOW_LABEL_VALUE
+GUARDED_LABELS = {
+    'http_requests_total': 'endpoint',
+    'inference_requests_total': 'model',
+    'inference_duration': 'model',
+    'model_load_duration': 'model_name',
+    'stream_first_chunk': 'model',
+    'stream_inter_chunk': 'model',
+    'stream_chunks': 'model',
+    'stream_throughput': 'model',
+    'model_downloads_total': 'model',
+    'model_storage_size': 'model',
+    'security_events_total': 'event_type',
+    'worker_queue_size': 'queue_name',
+    'stage_duration': 'model',
+    'model_cache_hits': 'model',
+    'model_cache_misses': 'model',
+    'model_cache_evictions': 'model',
+    'model_cache_served_bytes': 'model',
+    'model_download_bytes': 'model',
+    'model_fetch_duration': 'model',
+}
+
+# Path segments collapsed into placeholders when no route template is given
+_ROUTE_SEGMENTS = (
+    (re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'), ':uuid'),
+    (re.compile(r'^\d+$'), ':id'),
+    (re.compile(r'^[0-9a-fA-F]{16,}$'), ':hash'),
+)
+
+def normalize_endpoint(path):
+    """Collapse ids, uuids and hashes in a raw request path into a route template
+    
+    ``/assets/<uuid>/v2/17?x=1`` becomes ``/assets/:uuid/v2/:id``.
+    """
+    path = str(path).split('?', 1)[0]
+    segments = path.split('/')
+    for i, segment in enumerate(segments):
+        for pattern, placeholder in _ROUTE_SEGMENTS:
+            if pattern.match(segment):
+                segments[i] = placeholder
+                break
+    return '/'.join(segments)
+
+class CardinalityLimiter:
+    """Admits at most ``max_series`` label sets for one metric
+    
+    Label values are normalized first; once the cap is reached, new label
+    sets are counted on the ``rejected`` counter child and folded into a series whose guarded
+    label is OVERFLOW_LABEL_VALUE. Series admitted earlier keep working.
+    """
+    
+    def __init__(self, name, labelnames, guarded, max_series=MAX_SERIES_PER_METRIC,
+                 normalize=None, rejected=None):
+        self.name = name
+        self.max_series = max_series
+        self._position = list(labelnames).index(guarded)
+        self._normalize = normalize
+        self._rejected = rejected
+        self._admitted = set()
+        self._lock = threading.Lock()
+    
+    def admit(self, labelvalues):
+        """Return the label values to record under, possibly the overflow series"""
+        key = [str(v) for v in labelvalues]
+        if self._normalize is not None:
+            key[self._position] = self._normalize(key[self._position])
+        key = tuple(key)
+        if key in self._admitted:
+            return key
+        with self._lock:
+            if key in self._admitted or len(self._admitted) < self.max_series:
+                self._admitted.add(key)
+                return key
+        if self._rejected is not None:
+            self._rejected.inc()
+        key = list(key)
+        key[self._position] = OVERFLOW_LABEL_VALUE
+        return tuple(key)
+    
+    def release(self, labelvalues):
+        """Free the slot of a series that was removed"""
+        with self._lock:
+            self._admitted.discard(tuple(labelvalues))
+    
+    def __len__(self):
+        return len(self._admitted)
+
+# Idle-series eviction: series of these metrics not updated for their TTL are
+# removed on the next scrape (0 keeps them forever)
+SERIES_IDLE_TTL = float(os.environ.get('GAMEFORGE_METRICS_SERIES_TTL', '3600'))
+STORAGE_SERIES_IDLE_TTL = float(os.environ.get('GAMEFORGE_METRICS_STORAGE_SERIES_TTL', '86400'))
+IDLE_SERIES_TTLS = {
+    'inference_requests_total': SERIES_IDLE_TTL,
+    'inference_duration': SERIES_IDLE_TTL,
+    'stream_first_chunk': SERIES_IDLE_TTL,
+    'stream_inter_chunk': SERIES_IDLE_TTL,
+    'stream_chunks': SERIES_IDLE_TTL,
+    'stream_throughput': SERIES_IDLE_TTL,
+    'stage_duration': SERIES_IDLE_TTL,
+    'worker_queue_size': SERIES_IDLE_TTL,
+    'model_load_duration': STORAGE_SERIES_IDLE_TTL,
+    'model_storage_size': STORAGE_SERIES_IDLE_TTL,
+    'model_cache_hits': STORAGE_SERIES_IDLE_TTL,
+    'model_cache_misses': STORAGE_SERIES_IDLE_TTL,
+    'model_cache_evictions': STORAGE_SERIES_IDLE_TTL,
+    'model_cache_served_bytes': STORAGE_SERIES_IDLE_TTL,
+    'model_download_bytes': STORAGE_SERIES_IDLE_TTL,
+    'model_fetch_duration': STORAGE_SERIES_IDLE_TTL,
+}
+
+class _TrackedChild:
+    """Label child proxy stamping the time of the last update to its series"""
+    
+    __slots__ = ('_child', 'last_update')
+    
+    def __init__(self, child):
+        self._child = child
+        self.last_update = time.monotonic()
+    
+    def inc(self, amount=1, exemplar=None):
+        self.last_update = time.monotonic()
+        if exemplar is None:
+            self._child.inc(amount)
+        else:
+            self._child.inc(amount, exemplar)
+    
+    def dec(self, amount=1):
+        self.last_update = time.monotonic()
+        self._child.dec(amount)
+    
+    def set(self, value):
+        self.last_update = time.monotonic()
+        self._child.set(value)
+    
+    def observe(self, amount, exemplar=None):
+        self.last_update = time.monotonic()
+        self._child.observe(amount, exemplar)
+
+class _EvictedChild:
+    """Stand-in for an evicted series; the next update re-creates it"""
+    
+    __slots__ = ('_reattach',)
+    
+    def __init__(self, reattach):
+        self._reattach = reattach
+    
+    def inc(self, amount=1, exemplar=None):
+        if exemplar is None:
+            self._reattach().inc(amount)
+        else:
+            self._reattach().inc(amount, exemplar)
+    
+    def dec(self, amount=1):
+        self._reattach().dec(amount)
+    
+    def set(self, value):
+        self._reattach().set(value)
+    
+    def observe(self, amount, exemplar=None):
+        self._reattach().observe(amount, exemplar)
+
+class LabelCache:
+    """Bounded LRU of resolved label children keyed by the raw label tuple
+    
+    With ``idle_ttl`` set, children are wrapped to track their last update
+    and ``evict_idle`` removes series idle for longer than that. Children
+    already handed out (decorators, ``bind``) re-create their series on the
+    next update.
+    """
+    
+    def __init__(self, metric, maxsize=LABEL_CACHE_SIZE, resolve=None, limiter=None,
+                 idle_ttl=None, on_evict=None):
+        self.metric = metric
+        self.maxsize = maxsize
+        self.limiter = limiter
+        self.idle_ttl = idle_ttl
+        self._resolve_child = resolve or self._labels
+        self._on_evict = on_evict
+        self._children = OrderedDict()
+        self._tracked = {}  # series label values -> _TrackedChild
+        self._lock = threading.Lock()  # taken on misses only
+    
+    def get(self, *labelvalues):
+        """Return the child for positional label values, resolving it on a miss"""
+        try:
+            child = self._children[labelvalues]
+        except KeyError:
+            return self._resolve(labelvalues)
+        try:
+            self._children.move_to_end(labelvalues)
+        except KeyError:
+            pass  # evicted by another thread in between
+        return child
+    
+    def _labels(self, key):
+        return self.metric.labels(*key) if key else self.metric
+    
+    def _resolve(self, key):
+        # Cached under the raw key, so repeats skip the limiter entirely
+        series = key if self.limiter is None else self.limiter.admit(key)
+        child = self._track(series) if self.idle_ttl else self._resolve_child(series)
+        with self._lock:
+            self._children[key] = child
+            while len(self._children) > self.maxsize:
+                self._children.popitem(last=False)
+        return child
+    
+    def _track(self, series, tracked=None):
+        """The series' tracked child, adopting ``tracked`` if there is none yet"""
+        with self._lock:
+            current = self._tracked.get(series)
+            if current is None:
+                if tracked is None:
+                    tracked = _TrackedChild(self._resolve_child(series))
+                else:
+                    tracked._child = self._resolve_child(series)
+                current = self._tracked[series] = tracked
+            return current
+    
+    def _reattach(self, series, tracked):
+        """Re-create an evicted series for a child someone still holds"""
+        admitted = series if self.limiter is None else self.limiter.admit(series)
+        current = self._track(admitted, tracked if admitted == series else None)
+        if current is not tracked:
+            # The series came back under another child or overflowed; forward to it
+            tracked._child = current
+        return tracked._child
+    
+    def evict_idle(self, now=None):
+        """Remove series not updated for ``idle_ttl`` seconds, return how many
+        
+        An update racing the eviction either lands before the series is
+        removed, which keeps it, or goes through the evicted stand-in and
+        re-creates it. Only a thread stalled for a whole ``idle_ttl`` between
+        stamping and applying its update can still hit the removed child.
+        """
+        if not self.idle_ttl:
+            return 0
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        with self._lock:
+            for series, tracked in list(self._tracked.items()):
+                stamp = tracked.last_update
+                if now - stamp < self.idle_ttl:
+                    continue
+                child = tracked._child
+                tracked._child = _EvictedChild(
+                    lambda series=series, tracked=tracked: self._reattach(series, tracked))
+                # An update stamps last_update before loading _child, so one that
+                # loaded the live child before the swap shows up here; keep the series
+                if tracked.last_update != stamp:
+                    tracked._child = child
+                    continue
+                del self._tracked[series]
+                try:
+                    self.metric.remove(*series)
+                except KeyError:
+                    pass
+                if self.limiter is not None:
+                    self.limiter.release(series)
+                if self._on_evict is not None:
+                    self._on_evict(series)
+                evicted += 1
+        return evicted
+    
+    def __len__(self):
+        return len(self._children)
+
+class _Timer:
+    """Sync/async context manager recording one timed call on pre-resolved children"""
+    
+    __slots__ = ('_success', '_error', '_duration', '_trace_id', '_start_ns')
+    
+    def __init__(self, duration, success=None, error=None, trace_id=None):
+        self._duration = duration
+        self._success = success
+        self._error = error
+        self._trace_id = trace_id
+    
+    def __enter__(self):
+        self._start_ns = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        # GeneratorExit means a consumer stopped a stream early, not a failure
+        if exc_type is None or exc_type is GeneratorExit:
+            if self._success is not None:
+                self._success.inc()
+        elif issubclass(exc_type, Exception) and self._error is not None:
+            self._error.inc()
+        self._duration.observe((time.perf_counter_ns() - self._start_ns) / 1e9,
+                               _exemplar(self._trace_id or current_trace_id()))
+        return False
+    
+    async def __aenter__(self):
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class _StreamTimer(_Timer):
+    """_Timer that also records per-chunk latency and stream throughput"""
+    
+    __slots__ = ('_first_chunk', '_inter_chunk', '_chunks', '_throughput', '_count', '_last_ns')
+    
+    def __init__(self, duration, success, error, first_chunk, inter_chunk, chunks, throughput):
+        super().__init__(duration, success, error)
+        self._first_chunk = first_chunk
+        self._inter_chunk = inter_chunk
+        self._chunks = chunks
+        self._throughput = throughput
+    
+    def __enter__(self):
+        super().__enter__()
+        self._last_ns = self._start_ns
+        self._count = 0
+        return self
+    
+    def chunk(self):
+        """Mark one chunk handed to the consumer"""
+        now_ns = time.perf_counter_ns()
+        if self._count:
+            self._inter_chunk.observe((now_ns - self._last_ns) / 1e9)
+        else:
+            self._first_chunk.observe((now_ns - self._start_ns) / 1e9)
+        self._last_ns = now_ns
+        self._count += 1
+    
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = (time.perf_counter_ns() - self._start_ns) / 1e9
+        self._chunks.observe(self._count)
+        if self._count and elapsed > 0:
+            self._throughput.observe(self._count / elapsed)
+        return super().__exit__(exc_type, exc, tb)
+
+def _iter_stream(timer, iterable):
+    it = iter(iterable)
+    with timer:
+        try:
+            for item in it:
+                timer.chunk()
+                yield item
+        finally:
+            close = getattr(it, 'close', None)
+            if close is not None:
+                close()
+
+async def _aiter_stream(timer, iterable):
+    it = iterable.__aiter__()
+    with timer:
+        try:
+            async for item in it:
+                timer.chunk()
+                yield item
+        finally:
+            aclose = getattr(it, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+
+def _wrap_async(func, timer):
+    """Time coroutine, async generator and generator functions over their whole run
+    
+    ``timer`` is called with each call's arguments. Returns None for plain
+    callables, which the decorators wrap inline.
+    """
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timer(*args, **kwargs):
+                return await func(*args, **kwargs)
+    elif inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            agen = func(*args, **kwargs)
+            with timer(*args, **kwargs):
+                try:
+                    async for item in agen:
+                        yield item
+                finally:
+                    await agen.aclose()
+    elif inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(*args, **kwargs):
+                return (yield from func(*args, **kwargs))
+    else:
+        return None
+    return wrapper
+
+# Per-stage inference spans; a sampled fraction of root spans keep a full trace
+TRACE_SAMPLE_RATE = float(os.environ.get('GAMEFORGE_TRACE_SAMPLE_RATE', '0.01'))
+TRACE_RING_SIZE = int(os.environ.get('GAMEFORGE_TRACE_RING_SIZE', '256'))
+TRACE_MAX_SPANS = 512
+
+_current_span = contextvars.ContextVar('gameforge_current_span', default=None)
+
+# Exemplars: histogram buckets and the HTTP counter remember the trace/request ID
+# of their latest observation (one per bucket), shown in the OpenMetrics format
+EXEMPLARS = os.environ.get('GAMEFORGE_METRICS_EXEMPLARS', '1') == '1'
+EXEMPLAR_ID_LENGTH = 64
+
+_request_id = contextvars.ContextVar('gameforge_request_id', default=None)
+
+def current_trace_id():
+    """Request ID set by request_context, else the trace ID of a sampled span"""
+    request_id = _request_id.get()
+    if request_id is not None:
+        return request_id
+    span = _current_span.get()
+    return span._trace.trace_id if span is not None and span._trace is not None else None
+
+def _exemplar(trace_id):
+    """Exemplar labels for a trace/request ID, None when there is none"""
+    if trace_id is None or not EXEMPLARS:
+        return None
+    return {'trace_id': str(trace_id)[:EXEMPLAR_ID_LENGTH]}
+
+class _RequestContext:
+    """Sync/async context manager making a request ID the current exemplar ID"""
+    
+    __slots__ = ('_request_id', '_token')
+    
+    def __init__(self, request_id):
+        self._request_id = request_id
+    
+    def __enter__(self):
+        self._token = _request_id.set(self._request_id)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        _request_id.reset(self._token)
+        return False
+    
+    async def __aenter__(self):
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class _Trace:
+    """Spans of one sampled root span, in completion order"""
+    
+    __slots__ = ('trace_id', 'spans')
+    
+    def __init__(self):
+        self.trace_id = os.urandom(8).hex()
+        self.spans = []  # (stage, model, start ns, end ns, thread id, error)
+
+class _Span:
+    """Sync/async context manager timing one inference stage
+    
+    Nested spans inherit the model and trace of the enclosing span through a
+    ContextVar, so they nest across ``await`` points and threads started
+    with ``contextvars.copy_context()``.
+    """
+    
+    __slots__ = ('_metrics', 'stage', 'model', '_parent', '_trace', '_token', '_start_ns')
+    
+    def __init__(self, metrics_instance, stage, model=None):
+        self._metrics = metrics_instance
+        self.stage = stage
+        self.model = model
+    
+    @property
+    def trace_id(self):
+        """ID of the sampled trace this span belongs to, None when not sampled"""
+        return self._trace.trace_id if self._trace is not None else None
+    
+    def _open(self):
+        """Pick up the enclosing span's model and trace and start the clock"""
+        parent = self._parent = _current_span.get()
+        if parent is None:
+            sampled = random.random() < self._metrics.trace_sample_rate
+            self._trace = _Trace() if sampled else None
+            if self.model is None:
+                self.model = 'unknown'
+        else:
+            self._trace = parent._trace
+            if self.model is None:
+                self.model = parent.model
+        self._start_ns = time.perf_counter_ns()
+    
+    def _close(self, exc_type):
+        """Record the stage duration and, when sampled, the span itself"""
+        end_ns = time.perf_counter_ns()
+        self._metrics._label_caches['stage_duration'].get(self.model, self.stage).observe(
+            (end_ns - self._start_ns) / 1e9)
+        trace = self._trace
+        if trace is not None:
+            if len(trace.spans) < TRACE_MAX_SPANS:
+                trace.spans.append((self.stage, self.model, self._start_ns, end_ns,
+                                    threading.get_ident(), exc_type is not None))
+            if self._parent is None:
+                self._metrics._traces.append(trace)
+    
+    def __enter__(self):
+        self._open()
+        self._token = _current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            pass  # exited from another Context, which never saw the set()
+        self._close(exc_type)
+        return False
+    
+    async def __aenter__(self):
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+def _span_generator(span, gen):
+    """Run a generator under ``span``, active only while the generator itself runs
+    
+    Holding the ContextVar across a ``yield`` would leak the span into the
+    consumer, whose own spans would then nest under it.
+    """
+    span._open()
+    exc_type = None
+    try:
+        send, throw = None, None
+        while True:
+            token = _current_span.set(span)
+            try:
+                item = gen.send(send) if throw is None else gen.throw(throw)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                _current_span.reset(token)
+            send, throw = None, None
+            try:
+                send = yield item
+            except GeneratorExit:
+                raise
+            except BaseException as e:
+                throw = e
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        exc_type = type(e)
+        raise
+    finally:
+        token = _current_span.set(span)
+        try:
+            gen.close()
+        finally:
+            _current_span.reset(token)
+            span._close(exc_type)
+
+async def _span_async_generator(span, agen):
+    """Async counterpart of _span_generator"""
+    span._open()
+    exc_type = None
+    try:
+        send, throw = None, None
+        while True:
+            token = _current_span.set(span)
+            try:
+                item = await (agen.asend(send) if throw is None else agen.athrow(throw))
+            except StopAsyncIteration:
+                return
+            finally:
+                _current_span.reset(token)
+            send, throw = None, None
+            try:
+                send = yield item
+            except GeneratorExit:
+                raise
+            except BaseException as e:
+                throw = e
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        exc_type = type(e)
+        raise
+    finally:
+        token = _current_span.set(span)
+        try:
+            await agen.aclose()
+        finally:
+            _current_span.reset(token)
+            span._close(exc_type)
+
+# Buffered record_* mode: updates are queued and applied by a flusher thread
+METRICS_BUFFERED = os.environ.get('GAMEFORGE_METRICS_BUFFERED', '0') == '1'
+METRICS_BUFFER_SIZE = int(os.environ.get('GAMEFORGE_METRICS_BUFFER_SIZE', '65536'))
+METRICS_BUFFER_OVERFLOW = os.environ.get('GAMEFORGE_METRICS_BUFFER_OVERFLOW', 'drop_newest')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('GAMEFORGE_METRICS_FLUSH_INTERVAL', '1.0'))
+
+class MetricUpdateBuffer:
+    """Bounded queue of (metric-id, label-tuple, value) updates applied in bulk
+    
+    Appends rely on deque.append being atomic, so the request path takes no
+    lock. Overflow policies: 'drop_newest' rejects the update, 'drop_oldest'
+    discards the oldest queued update, 'inline' flushes on the caller's thread.
+    """
+    
+    OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'inline')
+    
+    def __init__(self, apply, maxsize=METRICS_BUFFER_SIZE, overflow=METRICS_BUFFER_OVERFLOW,
+                 dropped=None):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy {overflow!r}')
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self._apply = apply
+        self._dropped = dropped
+        self._queue = deque()
+        self._flush_lock = threading.Lock()
+        self._flush_interval = None  # set once a flusher thread runs
+    
+    def append(self, metric_id, labels=(), value=1):
+        """Queue one update; the only work done on the request path"""
+        queue = self._queue
+        if len(queue) >= self.maxsize:
+            if self.overflow == 'drop_newest':
+                self._drop()
+                return
+            if self.overflow == 'drop_oldest':
+                try:
+                    queue.popleft()
+                    self._drop()
+                except IndexError:
+                    pass
+            else:
+                self.flush()
+        queue.append((metric_id, labels, value))
+    
+    def _drop(self):
+        if self._dropped is not None:
+            self._dropped.inc()
+    
+    def flush(self):
+        """Apply every queued update, merging repeats of the same series"""
+        with self._flush_lock:
+            queue = self._queue
+            pending = {}
+            # Only drain what is queued now so busy writers cannot starve the flush
+            for _ in range(len(queue)):
+                try:
+                    metric_id, labels, value = queue.popleft()
+                except IndexError:
+                    break
+                key = (metric_id, labels)
+                # Counter increments add up; for gauges the last write wins
+                if key in pending and metric_id not in _BUFFERED_GAUGES:
+                    value += pending[key]
+                pending[key] = value
+            for (metric_id, labels), value in pending.items():
+                self._apply(metric_id, labels, value)
+    
+    def start_flusher(self, interval=METRICS_FLUSH_INTERVAL):
+        """Start a daemon thread that flushes every interval seconds
+        
+        Threads do not survive fork, so a child forked from a preloaded
+        master starts a flusher of its own.
+        """
+        if self._flush_interval is None and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        self._flush_interval = interval
+        
+        def flush_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error flushing buffered metrics: {e}")
+        
+        thread = threading.Thread(target=flush_loop, daemon=True)
+        thread.start()
+        return thread
+    
+    def _after_fork(self):
+        # Queued updates are the parent's to apply, and a flush running there
+        # at fork time leaves the copied lock held
+        self._queue.clear()
+        self._flush_lock = threading.Lock()
+        self.start_flusher(self._flush_interval)
+    
+    def __len__(self):
+        return len(self._queue)
+
+# Metric ids accepted by the update buffer whose value is set, not added
+_BUFFERED_GAUGES = frozenset(['worker_queue_size', 'active_connections'])
+
+# Shared-memory mode: workers write counters/histograms into one fixed-layout
+# segment that a single exporter process reads without file I/O or pickling.
+# The segment outlives every process; remove it with unlink_shared_segment()
+SHM_SEGMENT_NAME = os.environ.get('GAMEFORGE_METRICS_SHM')
+SHM_ROLE = os.environ.get('GAMEFORGE_METRICS_SHM_ROLE', 'worker')
+SHM_WORKER_SLOTS = int(os.environ.get('GAMEFORGE_METRICS_SHM_WORKERS', '64'))
+SHM_SERIES_SLOTS = int(os.environ.get('GAMEFORGE_METRICS_SHM_SERIES', '1024'))
+SHM_LABEL_BYTES = 192
+
+# Counters, histograms and gauges stored in the segment; the order is the on-segment id
+SHARED_METRICS = (
+    'http_requests_total', 'inference_requests_total',
+    'inference_duration', 'model_load_duration',
+    'stream_first_chunk', 'stream_inter_chunk',
+    'stream_chunks', 'stream_throughput',
+    'model_downloads_total', 'model_cache_hits', 'model_cache_misses',
+    'security_events_total', 'auth_attempts_total',
+    'stage_duration', 'model_cache_evictions',
+    'model_cache_served_bytes', 'model_download_bytes', 'model_fetch_duration',
+    'worker_queue_size', 'model_storage_size', 'active_connections',
+    'buffer_dropped', 'cardinality_rejected', 'series_evicted',
+)
+
+# Header, worker and slot records are multiples of 8 bytes and label bytes are
+# rounded up to one, so every float64 value is 8-byte aligned and never torn
+_SHM_MAGIC = b'GFM2'
+_SHM_HEADER = struct.Struct('<4sIIIIII4x')  # magic, layout crc, workers, series, label bytes, values, pad
+_SHM_WORKER = struct.Struct('<qI4x')      # pid, series used
+_SHM_SLOT = struct.Struct('<HH4x')        # metric id, label length
+_F64 = struct.Struct('<d')
+_LABEL_SEP = '\x1f'
+
+class SharedLayout:
+    """Metric id, kind, labels and bucket bounds shared by writers and the exporter
+    
+    Kinds are 'counter', 'histogram' (bucket counts then sum) and
+    'gauge:<multiprocess mode>' (value then the time it was set).
+    """
+    
+    def __init__(self, entries):
+        self.entries = entries  # (name, documentation, kind, labelnames, upper_bounds)
+        self.value_slots = max(len(bounds) + 1 if kind == 'histogram' else 2 if kind.startswith('gauge') else 1
+                               for _, _, kind, _, bounds in entries)
+        spec = repr([(name, kind, labelnames, bounds) for name, _, kind, labelnames, bounds in entries])
+        self.crc = zlib.crc32(spec.encode('utf-8'))
+    
+    @classmethod
+    def from_metrics(cls, metrics_instance):
+        entries = []
+        for attr in SHARED_METRICS:
+            metric = getattr(metrics_instance, attr)
+            bounds = tuple(getattr(metric, '_upper_bounds', ()))
+            kind = 'histogram' if bounds else 'counter'
+            if getattr(metric, '_type', None) == 'gauge':
+                kind = 'gauge:' + metric._multiprocess_mode
+            entries.append((metric._name, metric._documentation, kind,
+                            tuple(metric._labelnames), bounds))
+        return cls(entries)
+    
+    def index(self, attr):
+        return SHARED_METRICS.index(attr)
+
+class _SharedChild:
+    """Segment-backed child bound to a series of its writer's current region
+    
+    The region changes when a forked worker claims its own slot, so the
+    value offset is looked up again whenever the writer's generation moved.
+    """
+    
+    __slots__ = ('_writer', '_metric_id', '_raw', '_buf', '_generation', '_offset', '_lock')
+    
+    def __init__(self, writer, metric_id, raw):
+        self._writer = writer
+        self._metric_id = metric_id
+        self._raw = raw
+        self._buf = writer.segment.shm.buf
+        self._bind()
+    
+    def _bind(self):
+        self._generation = self._writer.generation
+        self._offset, self._lock = self._writer._lookup(self._metric_id, self._raw)
+    
+    def _current(self):
+        """Value offset in this process's region, None for series that did not fit"""
+        if self._generation != self._writer.generation:
+            self._bind()
+        return self._offset
+
+class _SharedCounterChild(_SharedChild):
+    """Counter child whose value lives at a fixed offset in the segment"""
+    
+    __slots__ = ()
+    
+    def inc(self, amount=1, exemplar=None):
+        # Exemplars are not kept in the segment
+        if amount < 0:
+            raise ValueError('Counters can only be incremented by non-negative amounts.')
+        offset = self._current()
+        if offset is None:
+            return
+        with self._lock:
+            value, = _F64.unpack_from(self._buf, offset)
+            _F64.pack_into(self._buf, offset, value + amount)
+
+class _SharedHistogramChild(_SharedChild):
+    """Histogram child storing per-bucket counts followed by the sum"""
+    
+    __slots__ = ('_upper_bounds',)
+    
+    def __init__(self, writer, metric_id, raw, upper_bounds):
+        self._upper_bounds = upper_bounds
+        super().__init__(writer, metric_id, raw)
+    
+    def observe(self, amount, exemplar=None):
+        offset = self._current()
+        if offset is None:
+            return
+        bucket_offset = offset + bisect.bisect_left(self._upper_bounds, amount) * 8
+        sum_offset = offset + len(self._upper_bounds) * 8
+        with self._lock:
+            count, = _F64.unpack_from(self._buf, bucket_offset)
+            _F64.pack_into(self._buf, bucket_offset, count + 1)
+            total, = _F64.unpack_from(self._buf, sum_offset)
+            _F64.pack_into(self._buf, sum_offset, total + amount)
+
+class _SharedGaugeChild(_SharedChild):
+    """Gauge child storing its value and the wall-clock time it was last set"""
+    
+    __slots__ = ()
+    
+    def _update(self, value=None, delta=0.0):
+        offset = self._current()
+        if offset is None:
+            return
+        with self._lock:
+            if value is None:
+                value = _F64.unpack_from(self._buf, offset)[0] + delta
+            struct.pack_into('<dd', self._buf, offset, value, time.time())
+    
+    def set(self, value):
+        self._update(value=float(value))
+    
+    def inc(self, amount=1, exemplar=None):
+        self._update(delta=amount)
+    
+    def dec(self, amount=1):
+        self._update(delta=-amount)
+
+def _merge_gauge(mode, current, values):
+    """Fold one worker's [value, set time] into the exported value for a gauge mode"""
+    if current is None:
+        return list(values)
+    if mode.endswith('mostrecent'):
+        return list(values) if values[1] > current[1] else current
+    if mode.endswith('max'):
+        return values if values[0] > current[0] else current
+    if mode.endswith('min'):
+        return values if values[0] < current[0] else current
+    if mode.endswith('sum') or mode == 'all':
+        return [current[0] + values[0], max(current[1], values[1])]
+    return current
+
+class SharedMetricsSegment:
+    """Fixed-layout multiprocessing.shared_memory store for a worker pool
+    
+    Layout: header, then one region per worker slot holding the owner PID,
+    the number of series in use and fixed-size series slots (metric id,
+    label bytes, float64 values). Each region has a single writer, so
+    workers never contend across processes; the exporter sums all regions.
+    
+    No process unlinks the segment on exit, its creator included: a worker
+    recycled by the pool must not take the segment away from the exporter
+    and its replacement. Call ``unlink_shared_segment`` once the pool and
+    the exporter are both stopped.
+    """
+    
+    def __init__(self, shm, layout):
+        self.shm = shm
+        self.layout = layout
+        magic, crc, workers, series, label_bytes, value_slots, _ = _SHM_HEADER.unpack_from(shm.buf, 0)
+        if magic != _SHM_MAGIC or crc != layout.crc:
+            raise ValueError(f'Shared metrics segment {shm.name!r} has an incompatible layout')
+        self.worker_slots = workers
+        self.series_slots = series
+        self.label_bytes = label_bytes
+        self.value_slots = value_slots
+        self.slot_size = _SHM_SLOT.size + label_bytes + value_slots * 8
+        self.worker_size = _SHM_WORKER.size + series * self.slot_size
+        self._labels = {}  # raw label bytes -> decoded tuple, exporter side
+    
+    @classmethod
+    def open(cls, name, layout, worker_slots=SHM_WORKER_SLOTS, series_slots=SHM_SERIES_SLOTS,
+             label_bytes=SHM_LABEL_BYTES):
+        """Attach to the named segment, creating it if this is the first process"""
+        label_bytes = (label_bytes + 7) & ~7
+        slot_size = _SHM_SLOT.size + label_bytes + layout.value_slots * 8
+        size = _SHM_HEADER.size + worker_slots * (_SHM_WORKER.size + series_slots * slot_size)
+        try:
+            shm = _untracked_shared_memory(name, create=True, size=size)
+            # The payload is zero-filled on creation; the magic goes in last
+            _SHM_HEADER.pack_into(shm.buf, 0, b'\0\0\0\0', layout.crc, worker_slots,
+                                  series_slots, label_bytes, layout.value_slots, 0)
+            shm.buf[0:4] = _SHM_MAGIC
+        except FileExistsError:
+            shm = _untracked_shared_memory(name)
+            deadline = time.monotonic() + 5
+            while bytes(shm.buf[0:4]) != _SHM_MAGIC and time.monotonic() < deadline:
+                time.sleep(0.01)  # creator is still writing the header
+        return cls(shm, layout)
+    
+    def _worker_offset(self, slot):
+        return _SHM_HEADER.size + slot * self.worker_size
+    
+    def _slot_offset(self, worker_offset, index):
+        return worker_offset + _SHM_WORKER.size + index * self.slot_size
+    
+    def _value_offset(self, worker_offset, index):
+        return self._slot_offset(worker_offset, index) + _SHM_SLOT.size + self.label_bytes
+    
+    def claim_worker_slot(self):
+        """Take a free slot, or the slot of a dead worker, for this process
+        
+        Counters of a dead worker stay in its slot and keep counting under
+        the new owner, so exported totals never go backwards.
+        """
+        pid = os.getpid()
+        lock_path = os.path.join(tempfile.gettempdir(), self.shm.name.lstrip('/') + '.lock')
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for slot in range(self.worker_slots):
+                offset = self._worker_offset(slot)
+                owner, _ = _SHM_WORKER.unpack_from(self.shm.buf, offset)
+                if owner == 0 or owner == pid or not psutil.pid_exists(owner):
+                    struct.pack_into('<q', self.shm.buf, offset, pid)
+                    return slot
+        raise RuntimeError(f'All {self.worker_slots} worker slots of {self.shm.name!r} are in use')
+    
+    def owners(self):
+        """PIDs currently holding a worker slot"""
+        pids = set()
+        for slot in range(self.worker_slots):
+            owner, _ = _SHM_WORKER.unpack_from(self.shm.buf, self._worker_offset(slot))
+            if owner:
+                pids.add(owner)
+        return pids
+    
+    def writer(self):
+        """Claim a worker slot and return a writer bound to it"""
+        return SharedSegmentWriter(self, self.claim_worker_slot())
+    
+    def _decode_labels(self, raw):
+        labels = self._labels.get(raw)
+        if labels is None:
+            labels = tuple(raw.decode('utf-8').split(_LABEL_SEP)) if raw else ()
+            self._labels[raw] = labels
+        return labels
+    
+    def read(self):
+        """Sum every worker region into {metric id: {label tuple: [values]}}"""
+        buf = self.shm.buf
+        totals = {}
+        value_count = self.value_slots
+        entries = self.layout.entries
+        for slot in range(self.worker_slots):
+            offset = self._worker_offset(slot)
+            owner, used = _SHM_WORKER.unpack_from(buf, offset)
+            if owner == 0:
+                continue
+            alive = None
+            for index in range(min(used, self.series_slots)):
+                slot_offset = self._slot_offset(offset, index)
+                metric_id, label_len = _SHM_SLOT.unpack_from(buf, slot_offset)
+                labels_start = slot_offset + _SHM_SLOT.size
+                labels = self._decode_labels(bytes(buf[labels_start:labels_start + label_len]))
+                values = struct.unpack_from(f'<{value_count}d', buf, labels_start + self.label_bytes)
+                series = totals.setdefault(metric_id, {})
+                current = series.get(labels)
+                kind = entries[metric_id][2]
+                if kind.startswith('gauge'):
+                    mode = kind.split(':', 1)[1]
+                    if mode.startswith('live'):
+                        if alive is None:
+                            alive = psutil.pid_exists(owner)
+                        if not alive:
+                            continue
+                    series[labels] = _merge_gauge(mode, current, values[:2])
+                elif current is None:
+                    series[labels] = list(values)
+                else:
+                    for i, value in enumerate(values):
+                        current[i] += value
+        return totals
+    
+    def close(self):
+        self.shm.close()
+    
+    def unlink(self):
+        _unlink_shared_memory(self.shm)
+
+def _untracked_shared_memory(name, create=False, size=0):
+    """Create or attach without letting this process's resource tracker unlink the segment"""
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+def _unlink_shared_memory(shm):
+    """Unlink an untracked segment; before 3.13 unlink() also unregisters it"""
+    if getattr(shm, '_track', True):
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.register(shm._name, 'shared_memory')
+        except Exception:
+            pass
+    shm.unlink()
+
+class SharedSegmentWriter:
+    """One worker's view of its region; hands out segment-backed children
+    
+    A process forked from one that already holds a writer (a preloaded
+    pre-fork master) claims a region of its own in the child, so every
+    region keeps a single writer.
+    """
+    
+    def __init__(self, segment, slot):
+        self.segment = segment
+        self.generation = 0
+        self._bind(slot)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+    
+    def _bind(self, slot):
+        segment = self.segment
+        self.slot = slot
+        self._offset = segment._worker_offset(slot)
+        self._lock = threading.Lock()  # series allocation
+        self._locks = {}  # slot index -> per-series update lock
+        self._series = {}  # (metric id, label bytes) -> slot index
+        self._overflowed = False
+        buf = segment.shm.buf
+        _, used = _SHM_WORKER.unpack_from(buf, self._offset)
+        # Adopt the series a previous owner of this slot left behind
+        for index in range(min(used, segment.series_slots)):
+            slot_offset = segment._slot_offset(self._offset, index)
+            metric_id, label_len = _SHM_SLOT.unpack_from(buf, slot_offset)
+            start = slot_offset + _SHM_SLOT.size
+            self._series[metric_id, bytes(buf[start:start + label_len])] = index
+            if segment.layout.entries[metric_id][2].startswith('gauge:live'):
+                struct.pack_into('<dd', buf, start + segment.label_bytes, 0.0, 0.0)
+    
+    def _after_fork(self):
+        try:
+            self._bind(self.segment.claim_worker_slot())
+        except Exception as e:
+            # Writing into the parent's region would race it; drop updates instead
+            print(f"Error claiming a shared metrics slot after fork: {e}")
+            self._offset = None
+        self.generation += 1
+    
+    def _lookup(self, metric_id, raw):
+        """Return (value offset, lock) for a series, allocating a slot on first use"""
+        if self._offset is None:
+            return None, None
+        key = (metric_id, raw)
+        index = self._series.get(key)
+        if index is None:
+            with self._lock:
+                index = self._series.get(key)
+                if index is None:
+                    index = self._allocate(metric_id, raw)
+                    if index is None:
+                        return None, None
+        lock = self._locks.get(index)
+        if lock is None:
+            lock = self._locks.setdefault(index, threading.Lock())
+        return self.segment._value_offset(self._offset, index), lock
+    
+    def _allocate(self, metric_id, raw):
+        segment = self.segment
+        buf = segment.shm.buf
+        _, used = _SHM_WORKER.unpack_from(buf, self._offset)
+        if used >= segment.series_slots or len(raw) > segment.label_bytes:
+            if not self._overflowed:
+                print(f"Shared metrics segment full, dropping new series of metric {metric_id}")
+                self._overflowed = True
+            return None
+        slot_offset = segment._slot_offset(self._offset, used)
+        _SHM_SLOT.pack_into(buf, slot_offset, metric_id, len(raw))
+        start = slot_offset + _SHM_SLOT.size
+        buf[start:start + len(raw)] = raw
+        # Publish the slot only once its metric id and labels are written
+        struct.pack_into('<I', buf, self._offset + 8, used + 1)
+        self._series[metric_id, raw] = used
+        return used
+    
+    def child(self, attr, labelvalues):
+        """Segment-backed child for a SHARED_METRICS attribute and label values"""
+        metric_id = self.segment.layout.index(attr)
+        raw = _LABEL_SEP.join(str(v) for v in labelvalues).encode('utf-8')
+        _, _, kind, _, bounds = self.segment.layout.entries[metric_id]
+        if kind == 'histogram':
+            return _SharedHistogramChild(self, metric_id, raw, bounds)
+        if kind.startswith('gauge'):
+            return _SharedGaugeChild(self, metric_id, raw)
+        return _SharedCounterChild(self, metric_id, raw)
+
+class SharedMemoryCollector:
+    """Exports the summed contents of a SharedMetricsSegment"""
+    
+    def __init__(self, segment, registry=REGISTRY):
+        self.segment = segment
+        if registry is not None:
+            registry.register(self)
+    
+    def collect(self):
+        totals = self.segment.read()
+        for metric_id, (name, documentation, kind, labelnames, bounds) in enumerate(self.segment.layout.entries):
+            series = totals.get(metric_id, {})
+            if kind == 'histogram':
+                family = HistogramMetricFamily(name, documentation, labels=labelnames)
+                for labels, values in sorted(series.items()):
+                    cumulative, buckets = 0.0, []
+                    for bound, count in zip(bounds, values):
+                        cumulative += count
+                        buckets.append((floatToGoString(bound), cumulative))
+                    family.add_metric(labels, buckets, values[len(bounds)])
+            elif kind.startswith('gauge'):
+                family = GaugeMetricFamily(name, documentation, labels=labelnames)
+                for labels, values in sorted(series.items()):
+                    family.add_metric(labels, values[0])
+            else:
+                family = CounterMetricFamily(name, documentation, labels=labelnames)
+                for labels, values in sorted(series.items()):
+                    family.add_metric(labels, values[0])
+            yield family
+
+# Minimum seconds between two NVML/psutil reads triggered by scrapes
+SYSTEM_COLLECT_TTL = float(os.environ.get('GAMEFORGE_METRICS_SYSTEM_TTL', '2.0'))
+
+# Per-GPU gauges: (key, metric name, help)
+GPU_GAUGES = (
+    ('utilization', 'gameforge_gpu_utilization_percent', 'GPU utilization percentage'),
+    ('memory_used', 'gameforge_gpu_memory_used_bytes', 'GPU memory used in bytes'),
+    ('memory_total', 'gameforge_gpu_memory_total_bytes', 'GPU memory total in bytes'),
+    ('temperature', 'gameforge_gpu_temperature_celsius', 'GPU temperature in Celsius'),
+)
+
+# GPU backend: 'auto', 'nvml', 'sysfs', 'fake' or 'none'
+GPU_BACKEND = os.environ.get('GAMEFORGE_GPU_BACKEND', 'auto')
+
+class GpuBackend(abc.ABC):
+    """Source of per-GPU readings
+    
+    Handles are opaque to callers and only passed back to the same backend.
+    Any method may raise; the caller then drops its cached handles.
+    """
+    
+    name = None
+    available = True
+    
+    @abc.abstractmethod
+    def device_count(self):
+        """Number of devices currently visible"""
+    
+    @abc.abstractmethod
+    def device_handle(self, index):
+        """Handle of the device at ``index``"""
+    
+    @abc.abstractmethod
+    def device_name(self, handle):
+        """Model name of the device"""
+    
+    @abc.abstractmethod
+    def utilization(self, handle):
+        """GPU utilization in percent"""
+    
+    @abc.abstractmethod
+    def memory(self, handle):
+        """(used bytes, total bytes)"""
+    
+    def temperature(self, handle):
+        """Temperature in Celsius, or None when the device has no sensor"""
+        return None
+    
+    # Extended telemetry; None means the backend or device does not support it
+    
+    def power(self, handle):
+        """(draw watts, enforced limit watts or None if unknown)"""
+        return None
+    
+    def clocks(self, handle):
+        """(SM clock MHz, memory clock MHz)"""
+        return None
+    
+    def throttle_reasons(self, handle):
+        """Bitmask of active GPU_THROTTLE_REASONS"""
+        return None
+    
+    def pcie_throughput(self, handle):
+        """(rx bytes/s, tx bytes/s)"""
+        return None
+    
+    def codec_utilization(self, handle):
+        """(encoder percent, decoder percent)"""
+        return None
+    
+    def ecc_errors(self, handle):
+        """(corrected, uncorrected) volatile ECC error counts"""
+        return None
+    
+    def process_memory(self, handle):
+        """{pid: used bytes} for compute processes on the device"""
+        return None
+    
+    def utilization_samples(self, handle, since):
+        """Driver-buffered (timestamp us, percent) utilization samples newer than since"""
+        return None
+
+class NullGpuBackend(GpuBackend):
+    """Backend for hosts without GPUs or with GPU metrics disabled; reports no devices"""
+    
+    name = 'none'
+    available = False
+    
+    def device_count(self):
+        return 0
+    
+    def device_handle(self, index):
+        raise IndexError(index)
+    
+    def device_name(self, handle):
+        raise IndexError(handle)
+    
+    def utilization(self, handle):
+        raise IndexError(handle)
+    
+    def memory(self, handle):
+        raise IndexError(handle)
+
+class NvmlGpuBackend(GpuBackend):
+    """NVIDIA GPUs through nvidia-ml-py"""
+    
+    name = 'nvml'
+    available = True
+    
+    def __init__(self):
+        if not NVIDIA_AVAILABLE:
+            raise RuntimeError('nvidia_ml_py3 is not installed')
+        nvml.nvmlInit()
+    
+    def device_count(self):
+        return nvml.nvmlDeviceGetCount()
+    
+    def device_handle(self, index):
+        return nvml.nvmlDeviceGetHandleByIndex(index)
+    
+    def device_name(self, handle):
+        name = nvml.nvmlDeviceGetName(handle)
+        # nvidia-ml-py returns bytes on older releases and str on newer ones
+        return name.decode('utf-8') if isinstance(name, bytes) else name
+    
+    def utilization(self, handle):
+        return nvml.nvmlDeviceGetUtilizationRates(handle).gpu
+    
+    def memory(self, handle):
+        mem_info = nvml.nvmlDeviceGetMemoryInfo(handle)
+        return mem_info.used, mem_info.total
+    
+    def temperature(self, handle):
+        try:
+            return nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU)
+        except Exception:
+            return None  # Temperature might not be available
+    
+    def power(self, handle):
+        return (nvml.nvmlDeviceGetPowerUsage(handle) / 1000.0,
+                nvml.nvmlDeviceGetEnforcedPowerLimit(handle) / 1000.0)
+    
+    def clocks(self, handle):
+        return (nvml.nvmlDeviceGetClockInfo(handle, nvml.NVML_CLOCK_SM),
+                nvml.nvmlDeviceGetClockInfo(handle, nvml.NVML_CLOCK_MEM))
+    
+    def throttle_reasons(self, handle):
+        # Renamed to "event reasons" in recent drivers
+        getter = getattr(nvml, 'nvmlDeviceGetCurrentClocksEventReasons', None) or \
+            nvml.nvmlDeviceGetCurrentClocksThrottleReasons
+        return getter(handle)
+    
+    def pcie_throughput(self, handle):
+        # NVML reports KB/s sampled over 20ms
+        return (nvml.nvmlDeviceGetPcieThroughput(handle, nvml.NVML_PCIE_UTIL_RX_BYTES) * 1024,
+                nvml.nvmlDeviceGetPcieThroughput(handle, nvml.NVML_PCIE_UTIL_TX_BYTES) * 1024)
+    
+    def codec_utilization(self, handle):
+        return (nvml.nvmlDeviceGetEncoderUtilization(handle)[0],
+                nvml.nvmlDeviceGetDecoderUtilization(handle)[0])
+    
+    def ecc_errors(self, handle):
+        return (nvml.nvmlDeviceGetTotalEccErrors(handle, nvml.NVML_MEMORY_ERROR_TYPE_CORRECTED,
+                                                 nvml.NVML_VOLATILE_ECC),
+                nvml.nvmlDeviceGetTotalEccErrors(handle, nvml.NVML_MEMORY_ERROR_TYPE_UNCORRECTED,
+                                                 nvml.NVML_VOLATILE_ECC))
+    
+    def process_memory(self, handle):
+        return {
+            proc.pid: proc.usedGpuMemory or 0
+            for proc in nvml.nvmlDeviceGetComputeRunningProcesses(handle)
+        }
+    
+    def utilization_samples(self, handle, since):
+        try:
+            _, samples = nvml.nvmlDeviceGetSamples(handle, nvml.NVML_GPU_UTILIZATION_SAMPLES, since)
+        except Exception as e:
+            # No sample newer than `since` is reported as an error by NVML
+            if 'NotFound' in type(e).__name__:
+                return []
+            raise
+        return [(sample.timeStamp, sample.sampleValue.uiVal) for sample in samples]
+
+class SysfsGpuBackend(GpuBackend):
+    """GPUs exposed by the kernel DRM subsystem (amdgpu and compatible drivers)"""
+    
+    name = 'sysfs'
+    available = True
+    
+    def __init__(self, root='/sys/class/drm'):
+        self.root = root
+    
+    def _cards(self):
+        cards = []
+        for path in sorted(glob.glob(os.path.join(self.root, 'card[0-9]*'))):
+            device = os.path.join(path, 'device')
+            # Connector entries (card0-DP-1) and non-compute cards lack this file
+            if os.path.basename(path)[4:].isdigit() and os.path.exists(os.path.join(device, 'gpu_busy_percent')):
+                cards.append(device)
+        return cards
+    
+    def device_count(self):
+        return len(self._cards())
+    
+    def device_handle(self, index):
+        return self._cards()[index]
+    
+    def _read(self, handle, filename):
+        with open(os.path.join(handle, filename)) as f:
+            return f.read().strip()
+    
+    def device_name(self, handle):
+        for filename in ('product_name', 'product_number'):
+            try:
+                name = self._read(handle, filename)
+                if name:
+                    return name
+            except OSError:
+                pass
+        try:
+            return f"{self._read(handle, 'vendor')}:{self._read(handle, 'device')}"
+        except OSError:
+            return os.path.basename(os.path.dirname(handle))
+    
+    def utilization(self, handle):
+        return int(self._read(handle, 'gpu_busy_percent'))
+    
+    def memory(self, handle):
+        return (int(self._read(handle, 'mem_info_vram_used')),
+                int(self._read(handle, 'mem_info_vram_total')))
+    
+    def _hwmon(self, handle, filename):
+        for path in glob.glob(os.path.join(handle, 'hwmon', 'hwmon*', filename)):
+            try:
+                with open(path) as f:
+                    return int(f.read())
+            except (OSError, ValueError):
+                pass
+        return None
+    
+    def temperature(self, handle):
+        millidegrees = self._hwmon(handle, 'temp1_input')
+        return None if millidegrees is None else millidegrees / 1000.0
+    
+    def power(self, handle):
+        # hwmon reports microwatts
+        draw = self._hwmon(handle, 'power1_average')
+        if draw is None:
+            return None
+        limit = self._hwmon(handle, 'power1_cap')
+        return draw / 1e6, None if limit is None else limit / 1e6
+    
+    def _active_clock(self, handle, filename):
+        # Lines look like "1: 1800Mhz *", the starred level is the current one
+        for line in self._read(handle, filename).splitlines():
+            if line.endswith('*'):
+                return int(line.split(':')[1].strip().lower().split('mhz')[0])
+        return None
+    
+    def clocks(self, handle):
+        try:
+            return self._active_clock(handle, 'pp_dpm_sclk'), self._active_clock(handle, 'pp_dpm_mclk')
+        except OSError:
+            return None
+
+class FakeGpuBackend(GpuBackend):
+    """Deterministic in-process GPUs for tests, benchmarks and CPU-only hosts
+    
+    ``utilization_curve(index, tick)`` returns the percentage reported on the
+    ``tick``-th read of a device; the default is a per-device triangle wave.
+    ``fail_next(index)`` makes the next read of a device raise, and
+    ``call_latency`` adds a fixed delay to every driver call.
+    """
+    
+    name = 'fake'
+    available = True
+    
+    def __init__(self, device_count=1, utilization_curve=None, memory_total=24 * 1024 ** 3,
+                 temperature=60.0, call_latency=0.0, name='GameForge Fake GPU'):
+        self.count = device_count
+        self.utilization_curve = utilization_curve or self._triangle
+        self.memory_total = memory_total
+        self.base_temperature = temperature
+        self.call_latency = call_latency
+        self.model_name = name
+        self._ticks = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _triangle(index, tick):
+        phase = (tick * 7 + index * 13) % 200
+        return phase if phase <= 100 else 200 - phase
+    
+    def set_device_count(self, count):
+        """Simulate a hot-plug or removal"""
+        self.count = count
+    
+    def fail_next(self, index, times=1, error=RuntimeError):
+        """Make the next ``times`` reads of a device raise ``error``"""
+        with self._lock:
+            self._failures[index] = (times, error)
+    
+    def _call(self, index):
+        if self.call_latency:
+            time.sleep(self.call_latency)
+        with self._lock:
+            if index >= self.count:
+                raise RuntimeError(f'Fake GPU {index} is gone')
+            pending = self._failures.get(index)
+            if pending is not None:
+                times, error = pending
+                if times <= 1:
+                    del self._failures[index]
+                else:
+                    self._failures[index] = (times - 1, error)
+                raise error(f'Injected failure on fake GPU {index}')
+    
+    def _tick(self, index):
+        with self._lock:
+            tick = self._ticks.get(index, 0)
+            self._ticks[index] = tick + 1
+        return tick
+    
+    def device_count(self):
+        return self.count
+    
+    def device_handle(self, index):
+        self._call(index)
+        return index
+    
+    def device_name(self, handle):
+        return self.model_name
+    
+    def utilization(self, handle):
+        self._call(handle)
+        return self.utilization_curve(handle, self._tick(handle))
+    
+    def memory(self, handle):
+        self._call(handle)
+        return int(self.memory_total * self.utilization_curve(handle, self._ticks.get(handle, 0)) / 100), self.memory_total
+    
+    def temperature(self, handle):
+        self._call(handle)
+        return self.base_temperature + handle
+    
+    def _load(self, handle):
+        return self.utilization_curve(handle, self._ticks.get(handle, 0)) / 100.0
+    
+    def power(self, handle):
+        self._call(handle)
+        return 80.0 + 220.0 * self._load(handle), 300.0
+    
+    def clocks(self, handle):
+        self._call(handle)
+        return int(1200 + 600 * self._load(handle)), 9501
+    
+    def throttle_reasons(self, handle):
+        self._call(handle)
+        # Report a software power cap whenever the fake load is near the limit
+        return 0x4 if self._load(handle) > 0.9 else 0x0
+    
+    def pcie_throughput(self, handle):
+        self._call(handle)
+        load = self._load(handle)
+        return int(4e9 * load), int(1e9 * load)
+    
+    def codec_utilization(self, handle):
+        self._call(handle)
+        return 0, 0
+    
+    def ecc_errors(self, handle):
+        self._call(handle)
+        return 0, 0
+    
+    def process_memory(self, handle):
+        self._call(handle)
+        return {os.getpid(): int(self.memory_total * self._load(handle) / 2)}
+    
+    def utilization_samples(self, handle, since):
+        # Emulate the driver buffer: one sample every 1/6 s, at most the last 120
+        self._call(handle)
+        step = 1_000_000 // 6
+        now = int(time.time() * 1_000_000) // step * step
+        first = max(since + step, now - 119 * step) if since else now - 5 * step
+        first = -(-first // step) * step
+        return [(ts, self.utilization_curve(handle, ts // step)) for ts in range(first, now + 1, step)]
+
+def create_gpu_backend(kind=GPU_BACKEND):
+    """Build the configured GPU backend; 'auto' prefers NVML, then sysfs"""
+    if kind == 'fake':
+        return FakeGpuBackend(int(os.environ.get('GAMEFORGE_FAKE_GPUS', '1')))
+    if kind == 'none':
+        return NullGpuBackend()
+    if kind in ('nvml', 'auto'):
+        try:
+            return NvmlGpuBackend()
+        except Exception as e:
+            if kind == 'nvml':
+                print(f"NVML unavailable, GPU metrics disabled: {e}")
+                return NullGpuBackend()
+    if kind in ('sysfs', 'auto'):
+        backend = SysfsGpuBackend()
+        if kind == 'sysfs' or backend.device_count():
+            return backend
+        return NullGpuBackend()
+    raise ValueError(f'Unknown GPU backend {kind!r}')
+
+# Read NVML's on-device utilization sample buffer instead of one point sample
+GPU_SAMPLING = os.environ.get('GAMEFORGE_GPU_SAMPLING', '0') == '1'
+GPU_SAMPLE_BUCKETS = (10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0, 100.0, float('inf'))
+# Most driver samples held for the window stats between two Prometheus collections
+GPU_SAMPLE_WINDOW_LIMIT = int(os.environ.get('GAMEFORGE_GPU_SAMPLE_WINDOW_LIMIT', '10000'))
+
+def _window_stats(values):
+    """(min, avg, max, p95) of a non-empty sample window"""
+    values = sorted(values)
+    p95 = values[max(0, math.ceil(0.95 * len(values)) - 1)]
+    return values[0], sum(values) / len(values), values[-1], p95
+
+class _GpuDevice:
+    """Cached backend handle, decoded name and label values of one GPU"""
+    
+    __slots__ = ('index', 'handle', 'name', 'labels', 'extended', 'unsupported',
+                 'last_sample_ts', 'sample_counts', 'sample_sum', 'window_samples')
+    
+    def __init__(self, index, handle, name):
+        self.index = index
+        self.handle = handle
+        self.name = name
+        self.labels = (str(index), name)
+        self.extended = {}  # last value read for each GPU_EXTENDED_FIELDS entry
+        self.unsupported = set()
+        # High-frequency sampling state: driver timestamp, cumulative histogram
+        # and the samples since the last Prometheus collection
+        self.last_sample_ts = 0
+        self.sample_counts = [0] * len(GPU_SAMPLE_BUCKETS)
+        self.sample_sum = 0.0
+        self.window_samples = deque(maxlen=GPU_SAMPLE_WINDOW_LIMIT)
+
+# Maximum age of the shared GPU snapshot before NVML is queried again
+GPU_SNAPSHOT_TTL = float(os.environ.get('GAMEFORGE_METRICS_GPU_TTL', '2.0'))
+
+# Wall-clock budget for extended GPU telemetry per collection cycle
+GPU_EXTENDED_BUDGET = float(os.environ.get('GAMEFORGE_GPU_EXTENDED_BUDGET', '0.05'))
+
+# Extended GpuBackend readers in priority order
+GPU_EXTENDED_FIELDS = (
+    'power', 'clocks', 'throttle_reasons', 'pcie_throughput',
+    'codec_utilization', 'ecc_errors', 'process_memory',
+)
+
+# NVML clock throttle reason bits
+GPU_THROTTLE_REASONS = (
+    (0x1, 'gpu_idle'),
+    (0x2, 'applications_clocks_setting'),
+    (0x4, 'sw_power_cap'),
+    (0x8, 'hw_slowdown'),
+    (0x10, 'sync_boost'),
+    (0x20, 'sw_thermal_slowdown'),
+    (0x40, 'hw_thermal_slowdown'),
+    (0x80, 'hw_power_brake_slowdown'),
+    (0x100, 'display_clock_setting'),
+)
+
+GpuReading = namedtuple('GpuReading', [
+    'index', 'name', 'labels', 'utilization', 'memory_used', 'memory_total', 'temperature',
+    'extended'
+])
+
+def _serving_pids(segment=None):
+    """PIDs whose GPU memory counts as ours: this process, its descendants and
+    the workers registered in the multiprocess directory or shared segment
+    
+    Workers are only counted once they have registered, not by matching
+    executables, so unrelated Python processes on the host stay out.
+    """
+    pids = {os.getpid()}
+    try:
+        pids.update(child.pid for child in psutil.Process().children(recursive=True))
+    except psutil.Error:
+        pass
+    if MULTIPROCESS:
+        pids.update(_worker_pids(MULTIPROC_DIR, '*.db'))
+    if segment is not None:
+        pids.update(segment.owners())
+    return pids
+
+class GpuSnapshot:
+    """Immutable set of GPU readings taken in one NVML pass"""
+    
+    __slots__ = ('readings', 'timestamp', 'monotonic')
+    
+    def __init__(self, readings):
+        self.readings = readings
+        self.timestamp = time.time()
+        self.monotonic = time.monotonic()
+    
+    def as_dict(self):
+        """JSON shape served by /metrics/gpu"""
+        return {
+            f'gpu_{r.index}': {
+                'name': r.name,
+                'utilization': r.utilization,
+                'memory_used': r.memory_used,
+                'memory_total': r.memory_total,
+                'memory_percent': (r.memory_used / r.memory_total) * 100 if r.memory_total else 0.0
+            }
+            for r in self.readings
+        }
+
+# Extended per-GPU gauges: (key, metric name, help)
+GPU_EXTENDED_GAUGES = (
+    ('power_draw', 'gameforge_gpu_power_draw_watts', 'GPU power draw in watts'),
+    ('power_limit', 'gameforge_gpu_power_limit_watts', 'Enforced GPU power limit in watts'),
+    ('sm_clock', 'gameforge_gpu_sm_clock_mhz', 'GPU SM clock in MHz'),
+    ('memory_clock', 'gameforge_gpu_memory_clock_mhz', 'GPU memory clock in MHz'),
+    ('pcie_rx', 'gameforge_gpu_pcie_rx_bytes_per_second', 'PCIe receive throughput in bytes per second'),
+    ('pcie_tx', 'gameforge_gpu_pcie_tx_bytes_per_second', 'PCIe transmit throughput in bytes per second'),
+    ('encoder', 'gameforge_gpu_encoder_utilization_percent', 'GPU video encoder utilization percentage'),
+    ('decoder', 'gameforge_gpu_decoder_utilization_percent', 'GPU video decoder utilization percentage'),
+)
+
+def _cpu_total(times):
+    """Sum of cpu_times fields; Linux already counts guest time inside user and nice"""
+    return sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+
+class SystemCollector:
+    """Custom collector reading GPU and system stats on scrape
+    
+    Results are reused for ``ttl`` seconds so concurrent or back-to-back
+    scrapes do not hammer the driver; an unscraped process does no work.
+    """
+    
+    def __init__(self, metrics_instance, ttl=SYSTEM_COLLECT_TTL, registry=REGISTRY):
+        self._metrics = metrics_instance
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._families = []
+        self._collected_at = None
+        if registry is not None:
+            registry.register(self)
+    
+    def _stale(self):
+        return self._collected_at is None or time.monotonic() - self._collected_at >= self.ttl
+    
+    def describe(self):
+        # Skip the NVML round-trip the registry would otherwise do on register()
+        return []
+    
+    def collect(self):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self._families = (self._metrics._collect_gpu_metrics() +
+                                      self._metrics._collect_system_metrics())
+                    self._collected_at = time.monotonic()
+        return self._families
+
+# Rolling-window latency quantiles for SLO tracking
+SLO_WINDOWS = (('1m', 60), ('5m', 300), ('1h', 3600))
+SLO_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+SLO_SLOT_SECONDS = 10
+# Pre-merged buckets for the longer windows, each a multiple of the one before
+SLO_COARSE_SECONDS = (60, 600)
+SLO_SKETCH_ACCURACY = float(os.environ.get('GAMEFORGE_SLO_SKETCH_ACCURACY', '0.01'))
+SLO_SKETCH_MAX_BINS = 2048
+# Default latency SLO: a fraction SLO_OBJECTIVE of inferences finish within
+# SLO_LATENCY_TARGET seconds; burn rates are only exported once a target is set
+SLO_LATENCY_TARGET = float(os.environ.get('GAMEFORGE_SLO_LATENCY_TARGET', '0') or 0) or None
+SLO_OBJECTIVE = float(os.environ.get('GAMEFORGE_SLO_OBJECTIVE', '0.99'))
+
+class QuantileSketch:
+    """DDSketch-style quantile sketch with bounded relative error
+    
+    Values land in logarithmic bins of ratio ``gamma``, so any quantile is
+    within ``accuracy`` of the true value no matter how wide the range of
+    latencies is. Once ``max_bins`` is exceeded the lowest bins are collapsed,
+    keeping memory bounded while the upper quantiles stay exact.
+    """
+    
+    __slots__ = ('_gamma', '_log_gamma', '_max_bins', '_bins', 'zero_count', 'count', 'sum')
+    
+    def __init__(self, accuracy=SLO_SKETCH_ACCURACY, max_bins=SLO_SKETCH_MAX_BINS):
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._max_bins = max_bins
+        self._bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+    
+    def _index(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+    
+    def _value(self, index):
+        return 2 * self._gamma ** index / (self._gamma + 1)
+    
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if value <= 1e-9:
+            self.zero_count += 1
+            return
+        index = self._index(value)
+        bins = self._bins
+        bins[index] = bins.get(index, 0) + 1
+        if len(bins) > self._max_bins:
+            self._collapse()
+    
+    def _collapse(self):
+        """Fold the lowest bins into one so at most max_bins remain"""
+        indexes = sorted(self._bins)
+        excess = len(indexes) - self._max_bins + 1
+        target = indexes[excess]
+        for index in indexes[:excess]:
+            self._bins[target] += self._bins.pop(index)
+    
+    def merge(self, other):
+        """Add another sketch's observations (same accuracy) into this one"""
+        bins = self._bins
+        for index, count in other._bins.items():
+            bins[index] = bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if len(bins) > self._max_bins:
+            self._collapse()
+    
+    def quantile(self, q):
+        """Approximate value at quantile q (0-1), None when empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self._bins):
+            seen += self._bins[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self._bins))
+    
+    def count_above(self, value):
+        """Approximate number of observations greater than value"""
+        if value <= 1e-9:
+            return self.count - self.zero_count
+        limit = self._index(value)
+        return sum(count for index, count in self._bins.items() if index > limit)
+
+class WindowedSketch:
+    """Ring of per-slot sketches merged on read into sliding windows
+    
+    Completed minutes and ten-minute spans (SLO_COARSE_SECONDS) are also kept
+    pre-merged, so a window is assembled from a few coarse buckets plus the
+    slots at its edges: an hour takes about 20 merges instead of 361.
+    """
+    
+    def __init__(self, horizon=SLO_WINDOWS[-1][1], slot_seconds=SLO_SLOT_SECONDS,
+                 coarse_seconds=SLO_COARSE_SECONDS):
+        self.horizon = horizon
+        self.slot_seconds = slot_seconds
+        self.retired = False
+        self._max_slots = math.ceil(horizon / slot_seconds) + 1
+        self._slots = deque()  # (slot id, sketch), oldest first
+        # Sealed coarse buckets per level, finest first: (width in slots, deque of (bucket id, sketch))
+        self._levels = [(max(1, round(seconds / slot_seconds)), deque()) for seconds in coarse_seconds]
+        self._lock = threading.Lock()
+    
+    def observe(self, value, now=None):
+        """Record one value; False when the sketch was retired and took nothing"""
+        slot = int((time.monotonic() if now is None else now) // self.slot_seconds)
+        with self._lock:
+            if self.retired:
+                return False
+            slots = self._slots
+            if not slots or slots[-1][0] != slot:
+                slots.append((slot, QuantileSketch()))
+                while len(slots) > self._max_slots:
+                    slots.popleft()
+            slots[-1][1].observe(value)
+        return True
+    
+    def retire(self, now=None):
+        """Stop taking values if nothing was observed within the horizon; True if retired"""
+        first = math.ceil(((time.monotonic() if now is None else now) - self.horizon) / self.slot_seconds)
+        with self._lock:
+            if not self._slots or self._slots[-1][0] < first:
+                self.retired = True
+                self._slots.clear()
+                for _, buckets in self._levels:
+                    buckets.clear()
+            return self.retired
+    
+    def _seal(self, current):
+        """Merge every completed bucket not sealed yet from the level below it"""
+        source, source_width = self._slots, 1
+        for width, buckets in self._levels:
+            last = buckets[-1][0] if buckets else None
+            pending = {}
+            for index, sketch in reversed(source):
+                bucket = index * source_width // width
+                if last is not None and bucket <= last:
+                    break
+                if bucket < current // width:
+                    pending.setdefault(bucket, []).append(sketch)
+            for bucket in sorted(pending):
+                merged = QuantileSketch()
+                for sketch in pending[bucket]:
+                    merged.merge(sketch)
+                buckets.append((bucket, merged))
+            oldest = (current - self._max_slots) // width
+            while buckets and buckets[0][0] < oldest:
+                buckets.popleft()
+            source, source_width = buckets, width
+    
+    def window(self, seconds, now=None):
+        """Merged sketch of the slots that started within the last ``seconds``"""
+        now = time.monotonic() if now is None else now
+        current = int(now // self.slot_seconds)
+        first = math.ceil((now - seconds) / self.slot_seconds)
+        merged = QuantileSketch()
+        sketches, covered = [], []
+        with self._lock:
+            self._seal(current)
+            # Coarsest first; a bucket is used when it lies wholly inside the window
+            # and no coarser bucket already holds it
+            for width, buckets in reversed(self._levels):
+                chosen = set()
+                for bucket, sketch in buckets:
+                    if bucket * width >= first and not any(
+                            bucket * width // wider in ids for wider, ids in covered):
+                        chosen.add(bucket)
+                        sketches.append(sketch)
+                covered.append((width, chosen))
+            for slot, sketch in self._slots:
+                if slot >= first and not any(slot // width in ids for width, ids in covered):
+                    if slot == current:
+                        merged.merge(sketch)  # still being observed into
+                    else:
+                        sketches.append(sketch)
+        for sketch in sketches:
+            merged.merge(sketch)
+        return merged
+
+class _SketchObserver:
+    """Histogram child that also feeds the model's rolling-window sketch"""
+    
+    __slots__ = ('_child', '_collector', '_model', '_window')
+    
+    def __init__(self, child, collector, model):
+        self._child = child
+        self._collector = collector
+        self._model = model
+        self._window = collector.window(model)
+    
+    def observe(self, amount, exemplar=None):
+        self._child.observe(amount, exemplar)
+        if not self._window.observe(amount):
+            # Pruned while the model was idle; pick up its new window
+            self._window = self._collector.window(self._model)
+            self._window.observe(amount)
+
+class InferenceSLOCollector:
+    """Per-model rolling latency quantiles and SLO burn rates
+    
+    Sketches live in process memory, so in multiprocess and shared-memory
+    modes each worker only sees its own inferences. Multiprocess scrapes
+    report the serving worker's view; the shared-memory exporter has none.
+    """
+    
+    def __init__(self, registry=REGISTRY):
+        self._windows = {}
+        self._targets = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+    
+    def window(self, model):
+        """The model's WindowedSketch, created on first use and after pruning"""
+        windowed = self._windows.get(model)
+        if windowed is None or windowed.retired:
+            with self._lock:
+                windowed = self._windows.get(model)
+                if windowed is None or windowed.retired:
+                    windowed = self._windows[model] = WindowedSketch()
+        return windowed
+    
+    def tee(self, resolve):
+        """Wrap a label resolver so its histogram children also feed the sketches"""
+        return lambda key: _SketchObserver(resolve(key), self, key[0])
+    
+    def set_target(self, model, latency_target, objective=SLO_OBJECTIVE):
+        """Latency SLO for one model: ``objective`` of calls within ``latency_target`` seconds"""
+        self._targets[model] = (latency_target, objective)
+    
+    def target(self, model):
+        if model in self._targets:
+            return self._targets[model]
+        if SLO_LATENCY_TARGET is not None:
+            return SLO_LATENCY_TARGET, SLO_OBJECTIVE
+        return None
+    
+    def summary(self, now=None):
+        """{model: {window: QuantileSketch}} for models with data in the longest window
+        
+        Models without any are pruned, so sketches of unloaded models do not
+        pile up; their next observation starts a fresh window.
+        """
+        now = time.monotonic() if now is None else now
+        result = {}
+        for model, windowed in list(self._windows.items()):
+            windows = {name: windowed.window(seconds, now) for name, seconds in SLO_WINDOWS}
+            if windows[SLO_WINDOWS[-1][0]].count:
+                result[model] = windows
+            elif windowed.retire(now):
+                with self._lock:
+                    if self._windows.get(model) is windowed:
+                        del self._windows[model]
+        return result
+    
+    @staticmethod
+    def burn_rate(sketch, target):
+        """Error-budget burn rate: slow fraction over the allowed slow fraction"""
+        latency_target, objective = target
+        if not sketch.count or objective >= 1:
+            return None
+        return sketch.count_above(latency_target) / sketch.count / (1 - objective)
+    
+    def describe(self):
+        return []
+    
+    def collect(self):
+        quantiles = SummaryMetricFamily(
+            'gameforge_inference_latency_window_seconds',
+            'Inference latency quantiles over sliding windows',
+            labels=['model', 'window']
+        )
+        burn = GaugeMetricFamily(
+            'gameforge_inference_slo_burn_rate',
+            'Latency SLO error-budget burn rate over sliding windows',
+            labels=['model', 'window']
+        )
+        for model, windows in self.summary().items():
+            target = self.target(model)
+            for window, sketch in windows.items():
+                quantiles.add_metric([model, window], sketch.count, sketch.sum)
+                for q in SLO_QUANTILES:
+                    value = sketch.quantile(q)
+                    if value is not None:
+                        quantiles.add_sample(
+                            quantiles.name,
+                            {'model': model, 'window': window, 'quantile': floatToGoString(q)},
+                            value
+                        )
+                rate = self.burn_rate(sketch, target) if target else None
+                if rate is not None:
+                    burn.add_metric([model, window], rate)
+        return [quantiles, burn]
+    
+    def as_dict(self):
+        """JSON shape served by /metrics/slo"""
+        result = {}
+        for model, windows in self.summary().items():
+            target = self.target(model)
+            entry = {'windows': {}}
+            for window, sketch in windows.items():
+                stats = {'count': sketch.count,
+                         'mean': sketch.sum / sketch.count if sketch.count else None}
+                for q in SLO_QUANTILES:
+                    stats[f'p{q * 100:g}'] = sketch.quantile(q)
+                if target:
+                    stats['burn_rate'] = self.burn_rate(sketch, target)
+                entry['windows'][window] = stats
+            if target:
+                entry['slo'] = {'latency_target': target[0], 'objective': target[1]}
+            result[model] = entry
+        return result
+
+# Sliding window, in seconds, of the per-model cache hit ratios
+MODEL_CACHE_RATIO_WINDOW = float(os.environ.get('GAMEFORGE_MODEL_CACHE_RATIO_WINDOW', '900'))
+
+# Counters feeding the ratios: metric -> (hit, counts bytes rather than lookups)
+CACHE_RATIO_SOURCES = {
+    'model_cache_hits': (True, False),
+    'model_cache_misses': (False, False),
+    'model_cache_served_bytes': (True, True),
+    'model_download_bytes': (False, True),
+}
+
+class _CacheRatioObserver:
+    """Counter child that also feeds the model's cache hit ratios"""
+    
+    __slots__ = ('_child', '_ratios', '_model', '_hit', '_counts_bytes')
+    
+    def __init__(self, child, ratios, model, hit, counts_bytes):
+        self._child = child
+        self._ratios = ratios
+        self._model = model
+        self._hit = hit
+        self._counts_bytes = counts_bytes
+    
+    def inc(self, amount=1, exemplar=None):
+        if exemplar is None:
+            self._child.inc(amount)
+        else:
+            self._child.inc(amount, exemplar)
+        if self._counts_bytes:
+            self._ratios.record(self._model, self._hit, amount, lookups=0)
+        else:
+            self._ratios.record(self._model, self._hit, lookups=amount)
+
+class CacheRatioCollector:
+    """Per-model model-cache hit ratios, by request and by byte, over a sliding window
+    
+    Counts are kept in SLO_SLOT_SECONDS slots per model; models without
+    lookups inside the window drop out. Per process, like the SLO sketches:
+    multiprocess scrapes report the serving worker's ratios and the
+    shared-memory exporter has none.
+    """
+    
+    def __init__(self, window=MODEL_CACHE_RATIO_WINDOW, slot_seconds=SLO_SLOT_SECONDS, registry=REGISTRY):
+        self.window = window
+        self.slot_seconds = slot_seconds
+        self._models = {}  # model -> deque of [slot, hits, misses, hit bytes, miss bytes]
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+    
+    def tee(self, resolve, hit, counts_bytes=False):
+        """Wrap a counter's label resolver so its increments also feed the ratios
+        
+        Ratios are keyed by the series the limiter admitted, matching the
+        exported counters.
+        """
+        return lambda key: _CacheRatioObserver(resolve(key), self, key[0], hit, counts_bytes)
+    
+    def record(self, model, hit, size_bytes=0, lookups=1, now=None):
+        slot = int((time.monotonic() if now is None else now) // self.slot_seconds)
+        oldest = slot - math.ceil(self.window / self.slot_seconds)
+        with self._lock:
+            slots = self._models.get(model)
+            if slots is None:
+                slots = self._models[model] = deque()
+            if not slots or slots[-1][0] != slot:
+                slots.append([slot, 0, 0, 0, 0])
+                while slots[0][0] <= oldest:
+                    slots.popleft()
+            entry = slots[-1]
+            if hit:
+                entry[1] += lookups
+                entry[3] += size_bytes
+            else:
+                entry[2] += lookups
+                entry[4] += size_bytes
+    
+    def totals(self, now=None):
+        """{model: (hits, misses, hit bytes, miss bytes)} inside the window"""
+        oldest = int((time.monotonic() if now is None else now) // self.slot_seconds) - \
+            math.ceil(self.window / self.slot_seconds)
+        result = {}
+        with self._lock:
+            for model, slots in list(self._models.items()):
+                while slots and slots[0][0] <= oldest:
+                    slots.popleft()
+                if not slots:
+                    del self._models[model]
+                    continue
+                result[model] = tuple(sum(entry[i] for entry in slots) for i in range(1, 5))
+        return result
+    
+    def describe(self):
+        return []
+    
+    def collect(self):
+        ratio = GaugeMetricFamily(
+            'gameforge_model_cache_hit_ratio',
+            'Model cache lookups served from cache over the sliding window',
+            labels=['model']
+        )
+        byte_ratio = GaugeMetricFamily(
+            'gameforge_model_cache_byte_hit_ratio',
+            'Model bytes served from cache rather than downloaded over the sliding window',
+            labels=['model']
+        )
+        for model, (hits, misses, hit_bytes, miss_bytes) in sorted(self.totals().items()):
+            # Lookups and their bytes are recorded separately and can fall in
+            # different slots, so either side may be empty within the window
+            if hits or misses:
+                ratio.add_metric([model], hits / (hits + misses))
+            if hit_bytes or miss_bytes:
+                byte_ratio.add_metric([model], hit_bytes / (hit_bytes + miss_bytes))
+        return [ratio, byte_ratio]
+
+class _CacheFetch:
+    """Sync/async context manager timing one model fetch through the cache
+    
+    Call ``hit(size)`` or ``miss(size)`` inside the block; a block that
+    marks neither counts as a miss. Misses are recorded as downloads with
+    status success or error depending on how the block exits.
+    """
+    
+    __slots__ = ('_metrics', 'model', '_hit', '_size', '_start_ns')
+    
+    def __init__(self, metrics_instance, model):
+        self._metrics = metrics_instance
+        self.model = model
+        self._hit = False
+        self._size = 0
+    
+    def hit(self, size_bytes=0):
+        """Mark the model as served from the on-disk cache"""
+        self._hit = True
+        self._size = size_bytes
+    
+    def miss(self, size_bytes=0):
+        """Mark the model as downloaded, ``size_bytes`` being the bytes fetched"""
+        self._hit = False
+        self._size = size_bytes
+    
+    def __enter__(self):
+        self._start_ns = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = (time.perf_counter_ns() - self._start_ns) / 1e9
+        metrics_instance = self._metrics
+        if self._hit:
+            metrics_instance.record_cache_hit(self.model, self._size)
+        else:
+            metrics_instance.record_cache_miss(self.model, self._size)
+            metrics_instance.record_model_download(self.model, 'error' if exc_type else 'success')
+        metrics_instance._label_caches['model_fetch_duration'].get(
+            self.model, 'cache' if self._hit else 'download').observe(elapsed)
+        return False
+    
+    async def __aenter__(self):
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+# Native (sparse exponential) histograms for inference and model-load durations;
+# file-backed and shared-memory modes only carry classic buckets. Off by default:
+# Prometheus ingests native histograms over the protobuf exposition, which is not
+# served here, and only the OpenMetrics 2.0 text format carries them
+NATIVE_HISTOGRAMS = os.environ.get('GAMEFORGE_METRICS_NATIVE_HISTOGRAMS', '0') == '1'
+NATIVE_HISTOGRAM_SCHEMA = int(os.environ.get('GAMEFORGE_NATIVE_HISTOGRAM_SCHEMA', '3'))
+NATIVE_HISTOGRAM_MAX_BUCKETS = int(os.environ.get('GAMEFORGE_NATIVE_HISTOGRAM_MAX_BUCKETS', '160'))
+NATIVE_HISTOGRAM_ZERO_THRESHOLD = 2.0 ** -128
+NATIVE_HISTOGRAM_MIN_SCHEMA = -4
+
+class ExponentialHistogram:
+    """Sparse base-2 exponential histogram in the Prometheus native layout
+    
+    Bucket ``i`` covers ``(base**(i-1), base**i]`` with ``base = 2**(2**-schema)``.
+    Only populated buckets are stored; when more than ``max_buckets`` are in
+    use the schema is lowered, merging neighbouring pairs, so memory stays
+    bounded and resolution adapts to the observed range. Durations only, so
+    every value at or below the zero threshold counts as zero.
+    """
+    
+    __slots__ = ('schema', 'max_buckets', '_scale', '_buckets', 'zero_count', 'count', 'sum', '_lock')
+    
+    def __init__(self, schema=NATIVE_HISTOGRAM_SCHEMA, max_buckets=NATIVE_HISTOGRAM_MAX_BUCKETS):
+        self.schema = schema
+        self.max_buckets = max_buckets
+        self._scale = 2.0 ** schema
+        self._buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if value <= NATIVE_HISTOGRAM_ZERO_THRESHOLD:
+                self.zero_count += 1
+                return
+            index = math.ceil(math.log2(value) * self._scale)
+            buckets = self._buckets
+            buckets[index] = buckets.get(index, 0) + 1
+            if len(buckets) > self.max_buckets:
+                self._downscale()
+    
+    def _downscale(self):
+        """Halve the resolution until the bucket count fits again"""
+        while len(self._buckets) > self.max_buckets and self.schema > NATIVE_HISTOGRAM_MIN_SCHEMA:
+            merged = {}
+            for index, count in self._buckets.items():
+                index = (index + 1) >> 1
+                merged[index] = merged.get(index, 0) + count
+            self._buckets = merged
+            self.schema -= 1
+            self._scale = 2.0 ** self.schema
+    
+    def native(self):
+        """Current state as a prometheus_client NativeHistogram sample value"""
+        with self._lock:
+            items = sorted(self._buckets.items())
+            count, total, zero_count, schema = self.count, self.sum, self.zero_count, self.schema
+        spans, deltas = [], []
+        previous_index, previous_count = None, 0
+        for index, bucket_count in items:
+            if previous_index is not None and index == previous_index + 1:
+                spans[-1] = BucketSpan(spans[-1].offset, spans[-1].length + 1)
+            else:
+                gap = index if previous_index is None else index - previous_index - 1
+                spans.append(BucketSpan(gap, 1))
+            deltas.append(bucket_count - previous_count)
+            previous_index, previous_count = index, bucket_count
+        return NativeHistogram(
+            count, total, schema, NATIVE_HISTOGRAM_ZERO_THRESHOLD, zero_count,
+            pos_spans=spans or None, pos_deltas=deltas or None
+        )
+
+class _NativeHistogramChild:
+    """Classic histogram child that also feeds its exponential histogram"""
+    
+    __slots__ = ('_child', '_native')
+    
+    def __init__(self, child, native):
+        self._child = child
+        self._native = native
+    
+    def observe(self, amount, exemplar=None):
+        self._child.observe(amount, exemplar)
+        self._native.observe(amount)
+
+class NativeHistogramCollector:
+    """Exposes a classic Histogram with a native histogram sample per label set
+    
+    The wrapped Histogram must be created with ``registry=None``; this
+    collector registers in its place and emits both representations in one
+    family. OpenMetrics 2.0 scrapers get the native sample, older formats
+    drop it and keep the classic buckets.
+    """
+    
+    def __init__(self, histogram, registry=REGISTRY):
+        self.histogram = histogram
+        self._natives = {}  # label values -> ExponentialHistogram
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+    
+    def native(self, key):
+        try:
+            return self._natives[key]
+        except KeyError:
+            with self._lock:
+                return self._natives.setdefault(key, ExponentialHistogram())
+    
+    def remove(self, key):
+        """Drop the native buckets of a removed series"""
+        self._natives.pop(key, None)
+    
+    def tee(self, resolve):
+        """Wrap a label resolver so its histogram children also feed the native buckets"""
+        return lambda key: _NativeHistogramChild(resolve(key), self.native(key))
+    
+    def describe(self):
+        return self.histogram.describe()
+    
+    def collect(self):
+        labelnames = self.histogram._labelnames
+        for family in self.histogram.collect():
+            # Each label set's native sample goes just before its classic samples
+            samples, seen = [], set()
+            for sample in family.samples:
+                key = tuple(sample.labels[name] for name in labelnames)
+                if key not in seen:
+                    seen.add(key)
+                    native = self._natives.get(key)
+                    if native is not None:
+                        samples.append(sample._replace(
+                            name=family.name, labels=dict(zip(labelnames, key)),
+                            value=None, timestamp=None, exemplar=None, native_histogram=native.native()
+                        ))
+                samples.append(sample)
+            family.samples = samples
+            yield family
+
+class _ClassicHistogramView:
+    """Registry view without native histogram samples, for the 0.0.4 text format"""
+    
+    def __init__(self, registry):
+        self._registry = registry
+    
+    def collect(self):
+        for metric in self._registry.collect():
+            if metric.type == 'histogram':
+                metric.samples = [s for s in metric.samples if s.native_histogram is None]
+            yield metric
+
+# Source tree root, used to find package.json and the git checkout
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+def _package_version():
+    """Version of the installed distribution, else the one in package.json"""
+    try:
+        from importlib import metadata
+        return metadata.version('gameforge')
+    except Exception:
+        pass
+    try:
+        with open(os.path.join(_REPO_ROOT, 'package.json')) as f:
+            return str(json.load(f).get('version', 'unknown'))
+    except (OSError, ValueError):
+        return 'unknown'
+
+def _git_sha():
+    """Commit the image was built from, else the checkout's HEAD"""
+    sha = os.environ.get('GAMEFORGE_GIT_SHA') or os.environ.get('GIT_COMMIT')
+    if sha:
+        return sha[:12]
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short=12', 'HEAD'],
+            cwd=_REPO_ROOT, capture_output=True, text=True, timeout=2, check=True
+        )
+        return result.stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+def build_info():
+    """Static build and runtime metadata for gameforge_app_info"""
+    return {
+        'version': os.environ.get('GAMEFORGE_VERSION') or _package_version(),
+        'git_sha': _git_sha(),
+        'python_version': platform.python_version(),
+        'environment': os.environ.get('GAMEFORGE_ENVIRONMENT', 'production'),
+        'deployment': os.environ.get('GAMEFORGE_DEPLOYMENT', 'vastai'),
+    }
+
 class GameForgeMetrics:
     """Production metrics collection for GameForge AI platform"""
     
-    def __init__(self):
-        # Initialize NVIDIA ML
-        if NVIDIA_AVAILABLE:
-            try:
-                nvml.nvmlInit()
-                self.gpu_available = True
-                self.gpu_count = nvml.nvmlDeviceGetCount()
-            except Exception:
-                self.gpu_available = False
-                self.gpu_count = 0
-        else:
-            self.gpu_available = False
-            self.gpu_count = 0
+    def __init__(self, buffered=METRICS_BUFFERED, shared_segment=None, gpu_backend=None,
+                 gpu_sampling=GPU_SAMPLING):
+        # GPU backend (NVML, sysfs, fake or none)
+        self.gpu_sampling = gpu_sampling
+        self._gpu_lock = threading.Lock()
+        self.gpu_count = 0
+        self._build_info = None
+        self._app_info_values = None
+        self.set_gpu_backend(gpu_backend or create_gpu_backend())
         
         # Application Metrics
-        self.http_requests_total = Counter(
+        # Per-thread shards live in process memory, so multiprocess mode uses
+        # the file-backed Counter instead
+        sharded = COUNTER_BACKEND == 'sharded' and not MULTIPROCESS
+        http_counter = ShardedCounter if sharded else Counter
+        self.http_requests_total = http_counter(
             'gameforge_http_requests_total',
             'Total HTTP requests',
             ['method', 'endpoint', 'status']
@@ -47,44 +2572,69 @@ class GameForgeMetrics:
             ['model', 'status']
         )
         
+        # Duration histograms also carry native buckets unless the classic
+        # buckets have to be shared across processes
+        native = NATIVE_HISTOGRAMS and not MULTIPROCESS and shared_segment is None
+        duration_registry = None if native else REGISTRY
         self.inference_duration = Histogram(
             'gameforge_inference_request_duration_seconds',
             'Inference request duration',
             ['model'],
-            buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+            buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+            registry=duration_registry
         )
         
         self.model_load_duration = Histogram(
             'gameforge_model_load_duration_seconds',
             'Model loading duration',
             ['model_name'],
-            buckets=[1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0]
+            buckets=[1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0],
+            registry=duration_registry
         )
         
-        # GPU Metrics
-        self.gpu_utilization = Gauge(
-            'gameforge_gpu_utilization_percent',
-            'GPU utilization percentage',
-            ['gpu_id', 'gpu_name']
+        self._native_histograms = {}
+        if native:
+            for name in ('inference_duration', 'model_load_duration'):
+                self._native_histograms[name] = NativeHistogramCollector(getattr(self, name))
+        
+        # Streaming Inference Metrics
+        self.stream_first_chunk = Histogram(
+            'gameforge_inference_time_to_first_chunk_seconds',
+            'Time from stream start to the first chunk',
+            ['model'],
+            buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+        )
+        
+        self.stream_inter_chunk = Histogram(
+            'gameforge_inference_inter_chunk_seconds',
+            'Latency between consecutive stream chunks',
+            ['model'],
+            buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
         )
         
-        self.gpu_memory_used = Gauge(
-            'gameforge_gpu_memory_used_bytes',
-            'GPU memory used in bytes',
-            ['gpu_id', 'gpu_name']
+        self.stream_chunks = Histogram(
+            'gameforge_inference_stream_chunks',
+            'Chunks produced per stream',
+            ['model'],
+            buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
         )
         
-        self.gpu_memory_total = Gauge(
-            'gameforge_gpu_memory_total_bytes',
-            'GPU memory total in bytes',
-            ['gpu_id', 'gpu_name']
+        self.stream_throughput = Histogram(
+            'gameforge_inference_stream_throughput_chunks_per_second',
+            'Stream throughput in chunks per second',
+            ['model'],
+            buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000]
         )
         
-        self.gpu_temperature = Gauge(
-            'gameforge_gpu_temperature_celsius',
-            'GPU temperature in Celsius',
-            ['gpu_id', 'gpu_name']
+        # Inference stage spans
+        self.stage_duration = Histogram(
+            'gameforge_inference_stage_duration_seconds',
+            'Inference stage duration (queue, preprocess, gpu, postprocess, ...)',
+            ['model', 'stage'],
+            buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
         )
+        self.trace_sample_rate = TRACE_SAMPLE_RATE
+        self._traces = deque(maxlen=TRACE_RING_SIZE)
         
         # Model Storage Metrics
         self.model_downloads_total = Counter(
@@ -95,18 +2645,47 @@ class GameForgeMetrics:
         
         self.model_cache_hits = Counter(
             'gameforge_model_cache_hits_total',
-            'Model cache hits'
+            'Model cache hits',
+            ['model']
         )
         
         self.model_cache_misses = Counter(
             'gameforge_model_cache_misses_total',
-            'Model cache misses'
+            'Model cache misses',
+            ['model']
+        )
+        
+        self.model_cache_evictions = Counter(
+            'gameforge_model_cache_evictions_total',
+            'Models evicted from the on-disk cache',
+            ['model']
+        )
+        
+        self.model_cache_served_bytes = Counter(
+            'gameforge_model_cache_served_bytes_total',
+            'Model bytes served from the on-disk cache',
+            ['model']
+        )
+        
+        self.model_download_bytes = Counter(
+            'gameforge_model_download_bytes_total',
+            'Model bytes downloaded on cache misses',
+            ['model']
+        )
+        
+        self.model_fetch_duration = Histogram(
+            'gameforge_model_fetch_duration_seconds',
+            'Model fetch duration by source (cache or download)',
+            ['model', 'source'],
+            buckets=[0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0]
         )
+        self.cache_ratios = CacheRatioCollector()
         
         self.model_storage_size = Gauge(
             'gameforge_model_storage_bytes',
             'Model storage size in bytes',
-            ['model']
+            ['model'],
+            multiprocess_mode='mostrecent'
         )
         
         # Security Metrics
@@ -126,12 +2705,14 @@ class GameForgeMetrics:
         self.worker_queue_size = Gauge(
             'gameforge_worker_queue_size',
             'Worker queue size',
-            ['queue_name']
+            ['queue_name'],
+            multiprocess_mode='livemax'
         )
         
         self.active_connections = Gauge(
             'gameforge_active_connections',
-            'Active connections'
+            'Active connections',
+            multiprocess_mode='livesum'
         )
         
         # Application Info
@@ -139,151 +2720,947 @@ class GameForgeMetrics:
             'gameforge_app_info',
             'Application information'
         )
+        self._build_info = build_info()
+        self._memory_total = psutil.virtual_memory().total
+        self._refresh_app_info()
         
-        # Start background metrics collection
-        self._start_background_collection()
-    
-    def _start_background_collection(self):
-        """Start background thread for continuous metrics collection"""
-        def collect_metrics():
-            while True:
-                try:
-                    self._collect_gpu_metrics()
-                    self._collect_system_metrics()
-                    time.sleep(5)  # Collect every 5 seconds
-                except Exception as e:
-                    print(f"Error in metrics collection: {e}")
-                    time.sleep(10)
+        # Exporter self-metrics
+        self.scrape_cache_lookups = Counter(
+            'gameforge_metrics_scrape_cache_total',
+            'Metrics snapshot cache lookups',
+            ['result']
+        )
         
-        thread = threading.Thread(target=collect_metrics, daemon=True)
-        thread.start()
+        self.buffer_dropped = Counter(
+            'gameforge_metrics_buffer_dropped_total',
+            'Buffered metric updates dropped on overflow'
+        )
+        
+        self.cardinality_rejected = Counter(
+            'gameforge_metrics_cardinality_rejected_total',
+            'Label sets folded into the overflow series by the cardinality guard',
+            ['metric']
+        )
+        
+        self.series_evicted = Counter(
+            'gameforge_metrics_series_evicted_total',
+            'Idle label series removed by the idle-series sweeper',
+            ['metric']
+        )
+        
+        self.gpu_extended_skipped = Counter(
+            'gameforge_gpu_extended_skipped_total',
+            'Extended GPU telemetry reads deferred by the collection time budget'
+        )
+        
+        # Shared-memory mode: counters and histograms write into the segment
+        self.shared_writer = None
+        self._shared_segment = None  # also set on the exporter by build_scrape_registry
+        if shared_segment is not None:
+            segment = SharedMetricsSegment.open(shared_segment, SharedLayout.from_metrics(self))
+            self.shared_writer = segment.writer()
+            self._shared_segment = segment
+        
+        # Rolling-window latency quantiles fed by inference_duration observations
+        self.latency_slo = InferenceSLOCollector()
+        
+        # Resolved label children for the record_* metrics
+        self._label_caches = {}
+        for name in (
+            'buffer_dropped', 'cardinality_rejected', 'series_evicted', 'active_connections',
+            'http_requests_total', 'inference_requests_total',
+            'inference_duration', 'model_load_duration',
+            'stream_first_chunk', 'stream_inter_chunk',
+            'stream_chunks', 'stream_throughput', 'stage_duration',
+            'model_downloads_total', 'model_storage_size',
+            'model_cache_hits', 'model_cache_misses', 'model_cache_evictions',
+            'model_cache_served_bytes', 'model_download_bytes', 'model_fetch_duration',
+            'security_events_total', 'auth_attempts_total',
+            'worker_queue_size',
+        ):
+            resolve = None
+            if self.shared_writer is not None and name in SHARED_METRICS:
+                resolve = lambda key, name=name: self.shared_writer.child(name, key)
+            if name in self._native_histograms:
+                metric = getattr(self, name)
+                resolve = self._native_histograms[name].tee(resolve or (lambda key, metric=metric: metric.labels(*key)))
+            if name == 'inference_duration':
+                resolve = self.latency_slo.tee(resolve or (lambda key: self.inference_duration.labels(*key)))
+            if name in CACHE_RATIO_SOURCES:
+                metric = getattr(self, name)
+                resolve = self.cache_ratios.tee(
+                    resolve or (lambda key, metric=metric: metric.labels(*key)), *CACHE_RATIO_SOURCES[name])
+            limiter = None
+            if name in GUARDED_LABELS:
+                limiter = CardinalityLimiter(
+                    name, getattr(self, name)._labelnames, GUARDED_LABELS[name],
+                    normalize=normalize_endpoint if name == 'http_requests_total' else None,
+                    rejected=self._label_caches['cardinality_rejected'].get(name)
+                )
+            # Removing a series cannot reach other processes' files or segment slots
+            idle_ttl = None
+            if not MULTIPROCESS and self.shared_writer is None:
+                idle_ttl = IDLE_SERIES_TTLS.get(name)
+            on_evict = None
+            if name in self._native_histograms:
+                on_evict = self._native_histograms[name].remove
+            self._label_caches[name] = LabelCache(
+                getattr(self, name), resolve=resolve, limiter=limiter,
+                idle_ttl=idle_ttl, on_evict=on_evict
+            )
+        
+        # Shared-memory workers write the connection gauge into the segment too
+        if self.shared_writer is not None:
+            self.active_connections = self._label_caches['active_connections'].get()
+        
+        # Optional buffered mode for the record_* methods
+        self._buffer = None
+        if buffered:
+            self._buffer = MetricUpdateBuffer(
+                self._apply_update, dropped=self._label_caches['buffer_dropped'].get())
+            self._buffer.start_flusher()
+        
+        # GPU and system stats are read on scrape, not by a polling thread
+        self._process = psutil.Process()
+        self._system_previous = None
+        self._collect_system_metrics()
+        self.system_collector = SystemCollector(self)
     
-    def _collect_gpu_metrics(self):
-        """Collect GPU metrics using nvidia-ml-py"""
-        if not self.gpu_available:
+    def set_gpu_backend(self, backend):
+        """Switch GPU backend and drop everything cached from the previous one"""
+        with self._gpu_lock:
+            self.gpu_backend = backend
+            self.gpu_available = backend.available
+            self._gpu_devices = None
+            self._gpu_snapshot = None
+            self._gpu_extended_cursor = 0
+        self.gpu_devices()
+    
+    def _discover_gpus(self):
+        """Build the per-device cache of backend handles, names and label values"""
+        backend = self.gpu_backend
+        devices = []
+        for i in range(backend.device_count()):
+            handle = backend.device_handle(i)
+            devices.append(_GpuDevice(i, handle, backend.device_name(handle)))
+        self._gpu_devices = devices
+        self.gpu_count = len(devices)
+        self._refresh_app_info()
+    
+    def _refresh_app_info(self):
+        """Rewrite gameforge_app_info only when one of its values changed"""
+        if self._build_info is None:
             return
+        values = dict(
+            self._build_info,
+            cpu_cores=str(psutil.cpu_count()),
+            memory_total=str(self._memory_total),
+            gpu_count=str(self.gpu_count)
+        )
+        if values != self._app_info_values:
+            self.app_info.info(values)
+            self._app_info_values = values
+    
+    def gpu_devices(self):
+        """Cached GPU devices, rebuilt after a hot-plug or device reset"""
+        if not self.gpu_available:
+            return []
+        try:
+            # The device count is the one backend call made per cycle to spot hot-plug
+            devices = self._gpu_devices
+            if devices is None or self.gpu_backend.device_count() != len(devices):
+                self._discover_gpus()
+        except Exception as e:
+            print(f"Error enumerating GPUs: {e}")
+            self._gpu_devices = None
+            return []
+        return self._gpu_devices
+    
+    def invalidate_gpu_cache(self):
+        """Drop cached device handles; the next collection re-enumerates devices"""
+        self._gpu_devices = None
+    
+    def _read_gpus(self):
+        """Query the backend once for every cached device"""
+        backend = self.gpu_backend
+        readings = []
+        for device in self.gpu_devices():
+            handle = device.handle
+            try:
+                utilization = backend.utilization(handle)
+                memory_used, memory_total = backend.memory(handle)
+                temperature = backend.temperature(handle)
+            except Exception as e:
+                # A reset or lost device invalidates its handle
+                print(f"Error collecting GPU metrics: {e}")
+                self.invalidate_gpu_cache()
+                continue
+            readings.append((device, utilization, memory_used, memory_total, temperature))
+            if self.gpu_sampling and 'utilization_samples' not in device.unsupported:
+                self._read_gpu_samples(device)
+        self._read_gpu_extended([device for device, *_ in readings])
+        return GpuSnapshot(tuple(
+            GpuReading(device.index, device.name, device.labels, utilization,
+                       memory_used, memory_total, temperature, dict(device.extended))
+            for device, utilization, memory_used, memory_total, temperature in readings
+        ))
+    
+    def _read_gpu_samples(self, device):
+        """Fold the driver's utilization samples since the last read into the
+        pending window and the cumulative utilization histogram
         
+        The window accumulates across snapshot refreshes and is only reset
+        when the Prometheus collector consumes it, so /metrics/gpu polling
+        neither steals samples from nor blanks the exported window stats.
+        """
         try:
-            for i in range(self.gpu_count):
-                handle = nvml.nvmlDeviceGetHandleByIndex(i)
-                
-                # GPU name
-                name = nvml.nvmlDeviceGetName(handle).decode('utf-8')
-                
-                # Utilization
-                util = nvml.nvmlDeviceGetUtilizationRates(handle)
-                self.gpu_utilization.labels(gpu_id=str(i), gpu_name=name).set(util.gpu)
-                
-                # Memory
-                mem_info = nvml.nvmlDeviceGetMemoryInfo(handle)
-                self.gpu_memory_used.labels(gpu_id=str(i), gpu_name=name).set(mem_info.used)
-                self.gpu_memory_total.labels(gpu_id=str(i), gpu_name=name).set(mem_info.total)
-                
-                # Temperature
-                try:
-                    temp = nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU)
-                    self.gpu_temperature.labels(gpu_id=str(i), gpu_name=name).set(temp)
-                except:
-                    pass  # Temperature might not be available
-                
+            samples = self.gpu_backend.utilization_samples(device.handle, device.last_sample_ts)
         except Exception as e:
-            print(f"Error collecting GPU metrics: {e}")
+            print(f"Error reading GPU utilization samples: {e}")
+            return
+        if samples is None:
+            device.unsupported.add('utilization_samples')
+            return
+        samples = [(ts, value) for ts, value in samples if ts > device.last_sample_ts]
+        if not samples:
+            return
+        device.last_sample_ts = max(ts for ts, _ in samples)
+        values = [value for _, value in samples]
+        for value in values:
+            device.sample_counts[bisect.bisect_left(GPU_SAMPLE_BUCKETS, value)] += 1
+        device.sample_sum += sum(values)
+        device.window_samples.extend(values)
+        device.extended['utilization_window'] = _window_stats(device.window_samples)
+        device.extended['utilization_histogram'] = (tuple(device.sample_counts), device.sample_sum)
+    
+    def _consume_gpu_windows(self):
+        """Window stats per device label values since the previous call, resetting the windows"""
+        stats = {}
+        with self._gpu_lock:
+            for device in self._gpu_devices or ():
+                if device.window_samples:
+                    stats[device.labels] = _window_stats(device.window_samples)
+                    device.window_samples.clear()
+        return stats
+    
+    def _read_gpu_extended(self, devices, budget=None):
+        """Refresh extended telemetry until the per-cycle time budget runs out
+        
+        Work items are (device, field) pairs visited round-robin from where the
+        previous cycle stopped, so slow drivers delay fields instead of starving
+        them; fields not reached keep their last value.
+        """
+        budget = GPU_EXTENDED_BUDGET if budget is None else budget
+        items = [(device, field) for field in GPU_EXTENDED_FIELDS for device in devices
+                 if field not in device.unsupported]
+        if not items:
+            return
+        backend = self.gpu_backend
+        deadline = time.perf_counter() + budget
+        start = self._gpu_extended_cursor % len(items)
+        done = 0
+        for offset in range(len(items)):
+            if time.perf_counter() >= deadline:
+                break
+            device, field = items[(start + offset) % len(items)]
+            done += 1
+            try:
+                value = getattr(backend, field)(device.handle)
+            except Exception as e:
+                if 'NotSupported' in type(e).__name__:
+                    device.unsupported.add(field)
+                continue
+            if value is None:
+                device.unsupported.add(field)
+            else:
+                device.extended[field] = value
+        self._gpu_extended_cursor = start + done
+        skipped = len(items) - done
+        if skipped:
+            self.gpu_extended_skipped.inc(skipped)
+    
+    def gpu_snapshot(self, max_age=GPU_SNAPSHOT_TTL):
+        """Latest GPU readings shared by the gauges, /metrics/gpu and get_gpu_metrics
+        
+        The backend is queried at most once per ``max_age`` seconds however many
+        callers there are; readers always see a complete snapshot because a
+        refresh swaps the whole object.
+        """
+        snapshot = self._gpu_snapshot
+        if snapshot is None or time.monotonic() - snapshot.monotonic >= max_age:
+            with self._gpu_lock:
+                snapshot = self._gpu_snapshot
+                if snapshot is None or time.monotonic() - snapshot.monotonic >= max_age:
+                    snapshot = self._read_gpus()
+                    self._gpu_snapshot = snapshot
+        return snapshot
+    
+    def _collect_gpu_metrics(self):
+        """Collect GPU metrics from the shared snapshot"""
+        families = {
+            key: GaugeMetricFamily(name, documentation, labels=['gpu_id', 'gpu_name'])
+            for key, name, documentation in GPU_GAUGES
+        }
+        for reading in self.gpu_snapshot().readings:
+            labels = reading.labels
+            families['utilization'].add_metric(labels, reading.utilization)
+            families['memory_used'].add_metric(labels, reading.memory_used)
+            families['memory_total'].add_metric(labels, reading.memory_total)
+            if reading.temperature is not None:
+                families['temperature'].add_metric(labels, reading.temperature)
+        return list(families.values()) + self._gpu_extended_families()
+    
+    def _gpu_extended_families(self):
+        """Gauge families for power, clocks, throttling, PCIe, codecs, ECC and process memory"""
+        gpu_labels = ['gpu_id', 'gpu_name']
+        families = {
+            key: GaugeMetricFamily(name, documentation, labels=gpu_labels)
+            for key, name, documentation in GPU_EXTENDED_GAUGES
+        }
+        throttle = GaugeMetricFamily(
+            'gameforge_gpu_throttle_reason_active',
+            'Whether a clock throttle reason is active (1) or not (0)',
+            labels=gpu_labels + ['reason']
+        )
+        ecc = CounterMetricFamily(
+            'gameforge_gpu_ecc_errors',
+            'Volatile ECC errors since the last driver load',
+            labels=gpu_labels + ['type']
+        )
+        process_memory = GaugeMetricFamily(
+            'gameforge_gpu_process_memory_bytes',
+            'GPU memory used by GameForge worker processes',
+            labels=gpu_labels + ['pid']
+        )
+        pids = None
+        for reading in self.gpu_snapshot().readings:
+            labels, extended = list(reading.labels), reading.extended
+            for field, keys in (('power', ('power_draw', 'power_limit')),
+                                ('clocks', ('sm_clock', 'memory_clock')),
+                                ('pcie_throughput', ('pcie_rx', 'pcie_tx')),
+                                ('codec_utilization', ('encoder', 'decoder'))):
+                values = extended.get(field)
+                if values is not None:
+                    for key, value in zip(keys, values):
+                        if value is not None:
+                            families[key].add_metric(labels, value)
+            reasons = extended.get('throttle_reasons')
+            if reasons is not None:
+                for bit, reason in GPU_THROTTLE_REASONS:
+                    throttle.add_metric(labels + [reason], 1 if reasons & bit else 0)
+            errors = extended.get('ecc_errors')
+            if errors is not None:
+                ecc.add_metric(labels + ['corrected'], errors[0])
+                ecc.add_metric(labels + ['uncorrected'], errors[1])
+            usage = extended.get('process_memory')
+            if usage:
+                if pids is None:
+                    pids = _serving_pids(self._shared_segment)
+                for pid, used in usage.items():
+                    if pid in pids:
+                        process_memory.add_metric(labels + [str(pid)], used)
+        return list(families.values()) + [throttle, ecc, process_memory] + self._gpu_sample_families()
+    
+    def _gpu_sample_families(self):
+        """Window stats and histogram built from the driver's utilization samples"""
+        if not self.gpu_sampling:
+            return []
+        gpu_labels = ['gpu_id', 'gpu_name']
+        window = GaugeMetricFamily(
+            'gameforge_gpu_utilization_window_percent',
+            'GPU utilization over the samples since the previous collection',
+            labels=gpu_labels + ['stat']
+        )
+        windows = self._consume_gpu_windows()
+        histogram = HistogramMetricFamily(
+            'gameforge_gpu_utilization_samples_percent',
+            'Distribution of driver-sampled GPU utilization',
+            labels=gpu_labels
+        )
+        for reading in self.gpu_snapshot().readings:
+            labels = list(reading.labels)
+            stats = windows.get(reading.labels)
+            if stats is not None:
+                for stat, value in zip(('min', 'avg', 'max', 'p95'), stats):
+                    window.add_metric(labels + [stat], value)
+            state = reading.extended.get('utilization_histogram')
+            if state is not None:
+                counts, total = state
+                cumulative, buckets = 0, []
+                for bound, count in zip(GPU_SAMPLE_BUCKETS, counts):
+                    cumulative += count
+                    buckets.append((floatToGoString(bound), cumulative))
+                histogram.add_metric(labels, buckets, total)
+        return [window, histogram]
     
     def _collect_system_metrics(self):
         """Collect system metrics"""
+        families = []
         try:
             # CPU and memory
-            cpu_percent = psutil.cpu_percent()
+            cpu_times = psutil.cpu_times(percpu=True)
             memory = psutil.virtual_memory()
+            swap = psutil.swap_memory()
+            disk = psutil.disk_io_counters()
+            net = psutil.net_io_counters()
+            now = time.monotonic()
+            
+            memory_family = GaugeMetricFamily(
+                'gameforge_system_memory_bytes', 'System memory by state', labels=['state'])
+            for state in ('total', 'available', 'used'):
+                memory_family.add_metric([state], getattr(memory, state))
+            swap_family = GaugeMetricFamily(
+                'gameforge_system_swap_bytes', 'System swap by state', labels=['state'])
+            for state in ('total', 'used'):
+                swap_family.add_metric([state], getattr(swap, state))
+            families += [memory_family, swap_family]
+            
+            if hasattr(os, 'getloadavg'):
+                load_family = GaugeMetricFamily(
+                    'gameforge_system_load_average', 'System load average', labels=['period'])
+                for period, value in zip(('1m', '5m', '15m'), os.getloadavg()):
+                    load_family.add_metric([period], value)
+                families.append(load_family)
             
-            # Update application info
-            self.app_info.info({
-                'version': '1.0.0',
-                'environment': 'production',
-                'deployment': 'vastai',
-                'cpu_cores': str(psutil.cpu_count()),
-                'memory_total': str(memory.total),
-                'gpu_count': str(self.gpu_count)
-            })
+            # Rates come from the delta against the previous collection
+            previous = self._system_previous
+            self._system_previous = (now, cpu_times, disk, net)
+            if previous is not None:
+                families += self._system_rate_families(previous, (now, cpu_times, disk, net))
+            
+            families += self._process_families()
             
         except Exception as e:
             print(f"Error collecting system metrics: {e}")
+        return families
+    
+    def _system_rate_families(self, previous, current):
+        """Per-core CPU busy percent and disk/network byte rates between two samples"""
+        (then, cpu_before, disk_before, net_before) = previous
+        (now, cpu_after, disk_after, net_after) = current
+        elapsed = now - then
+        if elapsed <= 0:
+            return []
+        families = []
+        
+        cpu_family = GaugeMetricFamily(
+            'gameforge_system_cpu_percent', 'CPU busy percentage per core', labels=['cpu'])
+        for cpu, (before, after) in enumerate(zip(cpu_before, cpu_after)):
+            total = _cpu_total(after) - _cpu_total(before)
+            idle = (after.idle + getattr(after, 'iowait', 0)) - (before.idle + getattr(before, 'iowait', 0))
+            cpu_family.add_metric([str(cpu)], 100.0 * (total - idle) / total if total > 0 else 0.0)
+        families.append(cpu_family)
+        
+        if disk_before is not None and disk_after is not None:
+            for direction, field in (('read', 'read_bytes'), ('write', 'write_bytes')):
+                delta = getattr(disk_after, field) - getattr(disk_before, field)
+                families.append(GaugeMetricFamily(
+                    f'gameforge_system_disk_{direction}_bytes_per_second',
+                    f'Disk {direction} throughput in bytes per second',
+                    value=max(delta, 0) / elapsed
+                ))
+        
+        if net_before is not None and net_after is not None:
+            for direction, field in (('receive', 'bytes_recv'), ('transmit', 'bytes_sent')):
+                delta = getattr(net_after, field) - getattr(net_before, field)
+                families.append(GaugeMetricFamily(
+                    f'gameforge_system_network_{direction}_bytes_per_second',
+                    f'Network {direction} throughput in bytes per second',
+                    value=max(delta, 0) / elapsed
+                ))
+        return families
+    
+    def _process_families(self):
+        """Open file descriptors, threads and RSS of the serving process"""
+        process = self._process
+        with process.oneshot():
+            values = [
+                ('gameforge_process_threads', 'Threads in the serving process', process.num_threads()),
+                ('gameforge_process_resident_memory_bytes', 'Resident memory of the serving process',
+                 process.memory_info().rss),
+            ]
+            if hasattr(process, 'num_fds'):
+                values.append(('gameforge_process_open_fds', 'Open file descriptors of the serving process',
+                               process.num_fds()))
+        return [GaugeMetricFamily(name, documentation, value=value) for name, documentation, value in values]
     
-    # Decorator for timing inference requests
-    def time_inference(self, model_name):
+    # Decorator for timing inference requests; ``trace_id`` optionally maps the
+    # call's arguments to the exemplar ID, which otherwise comes from the context
+    def time_inference(self, model_name, trace_id=None):
         def decorator(func):
+            # Resolve the label children once per decorated function
+            success = self._label_caches['inference_requests_total'].get(model_name, 'success')
+            error = self._label_caches['inference_requests_total'].get(model_name, 'error')
+            duration = self._label_caches['inference_duration'].get(model_name)
+            async_wrapper = _wrap_async(func, lambda *args, **kwargs: _Timer(
+                duration, success, error, trace_id(*args, **kwargs) if trace_id else None))
+            if async_wrapper is not None:
+                return async_wrapper
+            clock = time.perf_counter_ns
+            
             @wraps(func)
             def wrapper(*args, **kwargs):
-                start_time = time.time()
+                start_ns = clock()
                 try:
                     result = func(*args, **kwargs)
-                    self.inference_requests_total.labels(model=model_name, status='success').inc()
+                    success.inc()
                     return result
-                except Exception as e:
-                    self.inference_requests_total.labels(model=model_name, status='error').inc()
+                except Exception:
+                    error.inc()
                     raise
                 finally:
-                    duration = time.time() - start_time
-                    self.inference_duration.labels(model=model_name).observe(duration)
+                    elapsed = (clock() - start_ns) / 1e9
+                    call_id = trace_id(*args, **kwargs) if trace_id else None
+                    duration.observe(elapsed, _exemplar(call_id or current_trace_id()))
             return wrapper
         return decorator
     
     # Decorator for timing model loading
     def time_model_load(self, model_name):
         def decorator(func):
+            duration = self._label_caches['model_load_duration'].get(model_name)
+            async_wrapper = _wrap_async(func, lambda *args, **kwargs: _Timer(duration))
+            if async_wrapper is not None:
+                return async_wrapper
+            clock = time.perf_counter_ns
+            
             @wraps(func)
             def wrapper(*args, **kwargs):
-                start_time = time.time()
+                start_ns = clock()
                 try:
-                    result = func(*args, **kwargs)
-                    return result
+                    return func(*args, **kwargs)
                 finally:
-                    duration = time.time() - start_time
-                    self.model_load_duration.labels(model_name=model_name).observe(duration)
+                    duration.observe((clock() - start_ns) / 1e9)
+            return wrapper
+        return decorator
+    
+    def inference_timer(self, model_name, trace_id=None):
+        """Context manager (``with`` or ``async with``) timing one inference"""
+        return _Timer(
+            self._label_caches['inference_duration'].get(model_name),
+            self._label_caches['inference_requests_total'].get(model_name, 'success'),
+            self._label_caches['inference_requests_total'].get(model_name, 'error'),
+            trace_id
+        )
+    
+    def request_context(self, request_id):
+        """Context manager making ``request_id`` the exemplar ID for everything inside it"""
+        return _RequestContext(request_id)
+    
+    def set_latency_slo(self, model_name, latency_target, objective=SLO_OBJECTIVE):
+        """Set the latency SLO burn rates are computed against for one model"""
+        self.latency_slo.set_target(model_name, latency_target, objective)
+    
+    def model_load_timer(self, model_name):
+        """Context manager (``with`` or ``async with``) timing one model load"""
+        return _Timer(self._label_caches['model_load_duration'].get(model_name))
+    
+    def _stream_timer(self, model_name):
+        caches = self._label_caches
+        return _StreamTimer(
+            caches['inference_duration'].get(model_name),
+            caches['inference_requests_total'].get(model_name, 'success'),
+            caches['inference_requests_total'].get(model_name, 'error'),
+            caches['stream_first_chunk'].get(model_name),
+            caches['stream_inter_chunk'].get(model_name),
+            caches['stream_chunks'].get(model_name),
+            caches['stream_throughput'].get(model_name)
+        )
+    
+    def instrument_stream(self, model_name, stream):
+        """Wrap a sync or async iterable of chunks with streaming metrics
+        
+        Records time-to-first-chunk, inter-chunk latency, chunk count and
+        throughput, plus the usual inference status and end-to-end duration.
+        """
+        timer = self._stream_timer(model_name)
+        if hasattr(stream, '__aiter__'):
+            return _aiter_stream(timer, stream)
+        return _iter_stream(timer, stream)
+    
+    # Decorator for timing streaming inference (sync or async generators)
+    def time_stream(self, model_name):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.instrument_stream(model_name, func(*args, **kwargs))
+            return wrapper
+        return decorator
+    
+    def span(self, stage, model=None):
+        """Context manager (``with`` or ``async with``) timing one inference stage
+        
+        Spans nest: ``with metrics.span('request', 'sdxl'):`` around
+        ``with metrics.span('gpu'):`` records both stages for model sdxl, and a
+        sampled fraction of outermost spans keep the whole tree as a trace.
+        """
+        return _Span(self, stage, model)
+    
+    # Decorator for timing one inference stage
+    def time_stage(self, stage, model=None):
+        def decorator(func):
+            # Generators only get the span while they run, see _span_generator
+            if inspect.isgeneratorfunction(func):
+                @wraps(func)
+                def generator_wrapper(*args, **kwargs):
+                    return _span_generator(_Span(self, stage, model), func(*args, **kwargs))
+                return generator_wrapper
+            if inspect.isasyncgenfunction(func):
+                @wraps(func)
+                def async_generator_wrapper(*args, **kwargs):
+                    return _span_async_generator(_Span(self, stage, model), func(*args, **kwargs))
+                return async_generator_wrapper
+            async_wrapper = _wrap_async(func, lambda *args, **kwargs: _Span(self, stage, model))
+            if async_wrapper is not None:
+                return async_wrapper
+            
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with _Span(self, stage, model):
+                    return func(*args, **kwargs)
             return wrapper
         return decorator
     
-    def record_http_request(self, method, endpoint, status):
+    def export_traces(self):
+        """Sampled traces in the ring as Chrome trace-event JSON (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        events = []
+        for trace in list(self._traces):
+            for stage, model, start_ns, end_ns, tid, error in list(trace.spans):
+                events.append({
+                    'name': stage,
+                    'cat': model,
+                    'ph': 'X',
+                    'ts': start_ns / 1e3,
+                    'dur': (end_ns - start_ns) / 1e3,
+                    'pid': pid,
+                    'tid': tid,
+                    'args': {'trace_id': trace.trace_id, 'model': model, 'error': error},
+                })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+    
+    def bind(self, metric_name, **labels):
+        """Return a pre-resolved child of a labelled metric for hot call sites
+        
+        Example: ``ok = metrics.bind('http_requests_total', method='GET',
+        endpoint='/generate', status=200)`` then ``ok.inc()`` per request.
+        """
+        cache = self._label_caches.get(metric_name)
+        if cache is None:
+            raise ValueError(f'No labelled metric named {metric_name!r}')
+        labelnames = cache.metric._labelnames
+        if sorted(labels) != sorted(labelnames):
+            raise ValueError(f'{metric_name} expects labels {list(labelnames)}')
+        return cache.get(*(labels[name] for name in labelnames))
+    
+    def _apply_update(self, metric_id, labels, value):
+        """Apply one buffered update to its metric"""
+        target = self._label_caches[metric_id].get(*labels)
+        if metric_id in _BUFFERED_GAUGES:
+            target.set(value)
+        else:
+            target.inc(value)
+    
+    def flush(self):
+        """Apply buffered updates now (no-op unless buffered mode is on)"""
+        if self._buffer is not None:
+            self._buffer.flush()
+    
+    def evict_idle_series(self, now=None):
+        """Remove per-model and per-queue series idle past their metric's TTL"""
+        for name, cache in self._label_caches.items():
+            evicted = cache.evict_idle(now)
+            if evicted:
+                self._label_caches['series_evicted'].get(name).inc(evicted)
+    
+    def prepare_scrape(self):
+        """Bring shared state up to date right before the exposition is rendered"""
+        self.flush()
+        self.evict_idle_series()
+        if MULTIPROCESS:
+            reap_dead_workers()
+    
+    def record_http_request(self, method, endpoint, status, trace_id=None):
         """Record HTTP request metrics"""
-        self.http_requests_total.labels(method=method, endpoint=endpoint, status=str(status)).inc()
+        if self._buffer is not None:
+            # Buffered updates are merged per series, so they carry no exemplar
+            return self._buffer.append('http_requests_total', (method, endpoint, status))
+        self._label_caches['http_requests_total'].get(method, endpoint, status).inc(
+            1, _exemplar(trace_id or current_trace_id()))
     
     def record_security_event(self, event_type, severity='info'):
         """Record security events"""
-        self.security_events_total.labels(event_type=event_type, severity=severity).inc()
+        if self._buffer is not None:
+            return self._buffer.append('security_events_total', (event_type, severity))
+        self._label_caches['security_events_total'].get(event_type, severity).inc()
     
     def record_auth_attempt(self, status, method='password'):
         """Record authentication attempts"""
-        self.auth_attempts_total.labels(status=status, method=method).inc()
+        if self._buffer is not None:
+            return self._buffer.append('auth_attempts_total', (status, method))
+        self._label_caches['auth_attempts_total'].get(status, method).inc()
     
     def update_queue_size(self, queue_name, size):
         """Update worker queue size"""
-        self.worker_queue_size.labels(queue_name=queue_name).set(size)
+        if self._buffer is not None:
+            return self._buffer.append('worker_queue_size', (queue_name,), size)
+        self._label_caches['worker_queue_size'].get(queue_name).set(size)
     
     def record_model_download(self, model, status):
         """Record model download events"""
-        self.model_downloads_total.labels(model=model, status=status).inc()
+        if self._buffer is not None:
+            return self._buffer.append('model_downloads_total', (model, status))
+        self._label_caches['model_downloads_total'].get(model, status).inc()
+    
+    def record_cache_hit(self, model='unknown', size_bytes=0):
+        """Record model cache hit, ``size_bytes`` being the bytes served from cache"""
+        if self._buffer is not None:
+            self._buffer.append('model_cache_hits', (model,))
+            if size_bytes:
+                self._buffer.append('model_cache_served_bytes', (model,), size_bytes)
+            return
+        self._label_caches['model_cache_hits'].get(model).inc()
+        if size_bytes:
+            self._label_caches['model_cache_served_bytes'].get(model).inc(size_bytes)
+    
+    def record_cache_miss(self, model='unknown', size_bytes=0):
+        """Record model cache miss, ``size_bytes`` being the bytes downloaded instead"""
+        if self._buffer is not None:
+            self._buffer.append('model_cache_misses', (model,))
+            if size_bytes:
+                self._buffer.append('model_download_bytes', (model,), size_bytes)
+            return
+        self._label_caches['model_cache_misses'].get(model).inc()
+        if size_bytes:
+            self._label_caches['model_download_bytes'].get(model).inc(size_bytes)
+    
+    def record_cache_eviction(self, model='unknown'):
+        """Record a model evicted from the on-disk cache"""
+        if self._buffer is not None:
+            return self._buffer.append('model_cache_evictions', (model,))
+        self._label_caches['model_cache_evictions'].get(model).inc()
+    
+    def cache_fetch(self, model):
+        """Context manager (``with`` or ``async with``) timing one model fetch
+        
+        Example::
+        
+            with metrics.cache_fetch('sdxl') as fetch:
+                if cache.has('sdxl'):
+                    fetch.hit(cache.size('sdxl'))
+                else:
+                    fetch.miss(download('sdxl'))
+        """
+        return _CacheFetch(self, model)
+
+# Multiprocess helpers
+def build_scrape_registry(metrics_instance):
+    """Registry /metrics renders from; merges every worker's files in multiprocess mode
     
-    def record_cache_hit(self):
-        """Record model cache hit"""
-        self.model_cache_hits.inc()
+    The shared-memory exporter reports no inference SLO quantiles or model
+    cache hit ratios: their sketches and windows never leave the worker that
+    recorded them, so read /metrics/slo from the workers instead.
+    """
+    if SHM_SEGMENT_NAME and SHM_ROLE == 'exporter':
+        registry = CollectorRegistry()
+        segment = SharedMetricsSegment.open(SHM_SEGMENT_NAME, SharedLayout.from_metrics(metrics_instance))
+        SharedMemoryCollector(segment, registry)
+        metrics_instance._shared_segment = segment  # slot owners are the serving workers
+        # Workers write their counters, histograms and gauges into the segment;
+        # app info, node stats and the scrape-side counters are the exporter's own
+        registry.register(metrics_instance.app_info)
+        registry.register(metrics_instance.system_collector)
+        registry.register(metrics_instance.scrape_cache_lookups)
+        registry.register(metrics_instance.gpu_extended_skipped)
+        return registry
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    # Info has no file-backed value and GPU/system stats are node-wide, so the
+    # scraping worker reports its own copy of both
+    registry.register(metrics_instance.app_info)
+    registry.register(metrics_instance.system_collector)
+    # SLO sketches and cache ratios are in-process, so they cover the scraping worker only
+    registry.register(metrics_instance.latency_slo)
+    registry.register(metrics_instance.cache_ratios)
+    return registry
+
+def _worker_pids(path, pattern):
+    pids = set()
+    for filename in glob.glob(os.path.join(path, pattern)):
+        try:
+            pids.add(int(os.path.basename(filename).rsplit('_', 1)[1][:-len('.db')]))
+        except ValueError:
+            pass
+    return pids
+
+def reap_dead_workers(path=MULTIPROC_DIR):
+    """Drop live gauge files of worker PIDs that are no longer running
+    
+    Covers worker pools without a child-exit hook (e.g. uvicorn --workers);
+    counters and histograms of dead workers are kept so totals never go back.
+    """
+    for pid in _worker_pids(path, 'gauge_live*_*.db'):
+        if not psutil.pid_exists(pid):
+            multiprocess.mark_process_dead(pid, path)
+
+def cleanup_multiprocess_dir(path=MULTIPROC_DIR):
+    """Remove value files left by a previous run; call once before forking workers"""
+    for filename in glob.glob(os.path.join(path, '*.db')):
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+def unlink_shared_segment(name=SHM_SEGMENT_NAME):
+    """Remove the shared metrics segment; call once workers and exporter have stopped"""
+    if not name:
+        return
+    try:
+        shm = _untracked_shared_memory(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    _unlink_shared_memory(shm)
+
+# gunicorn server hooks, e.g. in gunicorn.conf.py:
+#   from gameforge_metrics import gunicorn_on_starting as on_starting
+#   from gameforge_metrics import gunicorn_child_exit as child_exit
+def gunicorn_on_starting(server):
+    """Start every master run with an empty multiprocess directory"""
+    if MULTIPROCESS:
+        cleanup_multiprocess_dir()
+
+def gunicorn_child_exit(server, worker):
+    """Forget the live gauges of a worker as soon as it exits"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(worker.pid)
+
+def choose_encoding(accept_encoding):
+    """Pick the best supported Content-Encoding from an Accept-Encoding header"""
+    best, best_q = 'identity', 0.0
+    for token in (accept_encoding or '').split(','):
+        parts = token.strip().split(';')
+        coding = parts[0].strip().lower()
+        if coding not in COMPRESSORS:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        # Ties go to the first supported coding in COMPRESSORS order
+        if q > best_q or (q == best_q and q > 0 and
+                          list(COMPRESSORS).index(coding) < list(COMPRESSORS).index(best)):
+            best, best_q = coding, q
+    return best
+
+class _Snapshot:
+    """One rendered exposition format plus its lazily compressed variants"""
+    
+    __slots__ = ('content_type', 'rendered_at', 'bodies')
+    
+    def __init__(self, body, content_type, rendered_at):
+        self.content_type = content_type
+        self.rendered_at = rendered_at
+        self.bodies = {'identity': body}
+
+class MetricsSnapshotCache:
+    """Pre-rendered exposition shared by every scraper within the TTL"""
+    
+    def __init__(self, registry=REGISTRY, ttl=METRICS_CACHE_TTL, lookups=None, before_render=None):
+        self.registry = registry
+        self.ttl = ttl
+        self.before_render = before_render
+        self._lock = threading.Lock()
+        self._snapshots = {}  # content type -> _Snapshot
+        if lookups is not None:
+            self._hits = lookups.labels(result='hit')
+            self._misses = lookups.labels(result='miss')
+        else:
+            self._hits = self._misses = None
+    
+    def _fresh(self, snapshot, now):
+        return snapshot is not None and now - snapshot.rendered_at < self.ttl
+    
+    def _snapshot(self, encoder, content_type):
+        snapshot = self._snapshots.get(content_type)
+        if self._fresh(snapshot, time.monotonic()):
+            if self._hits is not None:
+                self._hits.inc()
+            return snapshot
+        # Single render per interval; concurrent scrapers wait and reuse it
+        with self._lock:
+            snapshot = self._snapshots.get(content_type)
+            if self._fresh(snapshot, time.monotonic()):
+                if self._hits is not None:
+                    self._hits.inc()
+                return snapshot
+            if self.before_render is not None:
+                self.before_render()
+            body = encoder(self.registry)
+            snapshot = _Snapshot(body, content_type, time.monotonic())
+            self._snapshots[content_type] = snapshot
+            if self._misses is not None:
+                self._misses.inc()
+            return snapshot
+    
+    def get(self, accept=None, accept_encoding=None):
+        """Return the negotiated exposition body and its response headers"""
+        encoder, content_type = choose_encoder(accept)
+        if content_type.startswith('text/plain'):
+            # The classic text format has no way to carry native histogram samples
+            encoder = lambda registry, encoder=encoder: encoder(_ClassicHistogramView(registry))
+        encoding = choose_encoding(accept_encoding)
+        snapshot = self._snapshot(encoder, content_type)
+        body = snapshot.bodies.get(encoding)
+        if body is None:
+            with self._lock:
+                body = snapshot.bodies.get(encoding)
+                if body is None:
+                    body = COMPRESSORS[encoding](snapshot.bodies['identity'])
+                    snapshot.bodies[encoding] = body
+        headers = {
+            'Content-Type': content_type,
+            'Vary': 'Accept, Accept-Encoding',
+            'X-Metrics-Snapshot-Age': f'{time.monotonic() - snapshot.rendered_at:.3f}',
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return body, headers
     
-    def record_cache_miss(self):
-        """Record model cache miss"""
-        self.model_cache_misses.inc()
+    def invalidate(self):
+        """Force the next scrape to render a fresh snapshot"""
+        self._snapshots = {}
 
 # Global metrics instance
-metrics = GameForgeMetrics()
+metrics = GameForgeMetrics(
+    shared_segment=SHM_SEGMENT_NAME if SHM_ROLE == 'worker' else None
+)
+metrics_cache = MetricsSnapshotCache(
+    registry=build_scrape_registry(metrics),
+    lookups=metrics.scrape_cache_lookups,
+    before_render=metrics.prepare_scrape
+)
 
 # Flask app for metrics endpoint (only create if running standalone)
 def create_metrics_app():
     """Create Flask app for metrics - only when needed"""
-    from flask import Flask, Response
+    from flask import Flask, Response, request
     app = Flask(__name__)
 
     @app.route('/metrics')
     def prometheus_metrics():
         """Prometheus metrics endpoint"""
-        return Response(generate_latest(), mimetype='text/plain')
+        body, headers = metrics_cache.get(
+            request.headers.get('Accept'),
+            request.headers.get('Accept-Encoding')
+        )
+        return Response(body, headers=headers)
 
     @app.route('/health')
     def health_check():
@@ -293,33 +3670,28 @@ def create_metrics_app():
     @app.route('/metrics/gpu')
     def gpu_metrics():
         """GPU-specific metrics endpoint"""
-        gpu_data = {}
-        if metrics.gpu_available:
-            for i in range(metrics.gpu_count):
-                try:
-                    handle = nvml.nvmlDeviceGetHandleByIndex(i)
-                    name = nvml.nvmlDeviceGetName(handle).decode('utf-8')
-                    util = nvml.nvmlDeviceGetUtilizationRates(handle)
-                    mem_info = nvml.nvmlDeviceGetMemoryInfo(handle)
-                    
-                    gpu_data[f'gpu_{i}'] = {
-                        'name': name,
-                        'utilization': util.gpu,
-                        'memory_used': mem_info.used,
-                        'memory_total': mem_info.total,
-                        'memory_percent': (mem_info.used / mem_info.total) * 100
-                    }
-                except:
-                    pass
-        
-        return gpu_data
+        return metrics.gpu_snapshot().as_dict()
+
+    @app.route('/metrics/traces')
+    def traces():
+        """Sampled inference traces as Chrome trace-event JSON"""
+        return metrics.export_traces()
+
+    @app.route('/metrics/slo')
+    def slo_metrics():
+        """Rolling-window inference latency quantiles and SLO burn rates"""
+        return metrics.latency_slo.as_dict()
     
     return app
 
 # Metrics endpoint functions for FastAPI integration
 def get_prometheus_metrics():
     """Get Prometheus metrics as string"""
-    return generate_latest()
+    return metrics_cache.get()[0]
+
+def get_prometheus_snapshot(accept=None, accept_encoding=None):
+    """Get cached, negotiated Prometheus metrics as (body, headers)"""
+    return metrics_cache.get(accept, accept_encoding)
 
 def get_health_status():
     """Get health check status"""
@@ -327,26 +3699,15 @@ def get_health_status():
 
 def get_gpu_metrics():
     """Get GPU metrics data"""
-    gpu_data = {}
-    if metrics.gpu_available:
-        for i in range(metrics.gpu_count):
-            try:
-                handle = nvml.nvmlDeviceGetHandleByIndex(i)
-                name = nvml.nvmlDeviceGetName(handle).decode('utf-8')
-                util = nvml.nvmlDeviceGetUtilizationRates(handle)
-                mem_info = nvml.nvmlDeviceGetMemoryInfo(handle)
-                
-                gpu_data[f'gpu_{i}'] = {
-                    'name': name,
-                    'utilization': util.gpu,
-                    'memory_used': mem_info.used,
-                    'memory_total': mem_info.total,
-                    'memory_percent': (mem_info.used / mem_info.total) * 100
-                }
-            except:
-                pass
-    
-    return gpu_data
+    return metrics.gpu_snapshot().as_dict()
+
+def get_slo_metrics():
+    """Get rolling-window inference latency quantiles and SLO burn rates"""
+    return metrics.latency_slo.as_dict()
+
+def get_traces():
+    """Get sampled inference traces as Chrome trace-event JSON"""
+    return metrics.export_traces()
 
 if __name__ == '__main__':
     # Run standalone metrics server
@@ -0,0 +1,912 @@
+# ========================================================================
+# GameForge Metrics Tests
+# Run with: python -m pytest src/metrics (or python -m unittest discover src/metrics)
+# ========================================================================
+
+import asyncio
+import gzip
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+os.environ.setdefault('GAMEFORGE_GPU_BACKEND', 'fake')
+
+from prometheus_client import CollectorRegistry, Counter
+
+import gameforge_metrics
+from gameforge_metrics import (
+    CardinalityLimiter, ExponentialHistogram, FakeGpuBackend, GpuBackend, LabelCache,
+    NullGpuBackend, OVERFLOW_LABEL_VALUE, QuantileSketch, SHARED_METRICS, ShardedCounter,
+    SharedLayout, SharedMetricsSegment, WindowedSketch, metrics, normalize_endpoint,
+)
+
+def _sample(family_list, name, labels=None):
+    """Value of one sample across collected families, None when absent"""
+    for family in family_list:
+        for sample in family.samples:
+            if sample.name == name and (labels is None or sample.labels == labels):
+                return sample.value
+    return None
+
+class SnapshotCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        self.counter = Counter('test_scraped', 'Test', registry=self.registry)
+        lookups_registry = CollectorRegistry()
+        lookups = Counter('test_lookups', 'Test', ['result'], registry=lookups_registry)
+        self.lookups = lambda result: lookups_registry.get_sample_value(
+            'test_lookups_total', {'result': result}) or 0
+        self.renders = []
+        self.cache = gameforge_metrics.MetricsSnapshotCache(
+            registry=self.registry, ttl=60, lookups=lookups,
+            before_render=lambda: self.renders.append(time.monotonic()))
+
+    def test_scrapes_within_ttl_share_one_render(self):
+        first, headers = self.cache.get()
+        self.counter.inc()
+        second, _ = self.cache.get()
+        self.assertIs(second, first)
+        self.assertIn(b'test_scraped_total 0.0', second)
+        self.assertEqual(len(self.renders), 1)
+        self.assertEqual((self.lookups('miss'), self.lookups('hit')), (1, 1))
+        self.assertIn('X-Metrics-Snapshot-Age', headers)
+
+    def test_expired_or_invalidated_snapshot_renders_again(self):
+        self.cache.get()
+        self.counter.inc()
+        self.cache.invalidate()
+        self.assertIn(b'test_scraped_total 1.0', self.cache.get()[0])
+        self.cache.ttl = 0
+        self.counter.inc()
+        self.assertIn(b'test_scraped_total 2.0', self.cache.get()[0])
+        self.assertEqual(self.lookups('miss'), 3)
+
+    def test_concurrent_scrapers_wait_for_a_single_render(self):
+        barrier = threading.Barrier(8)
+
+        def scrape():
+            barrier.wait()
+            self.cache.get()
+
+        threads = [threading.Thread(target=scrape) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.renders), 1)
+        self.assertEqual((self.lookups('miss'), self.lookups('hit')), (1, 7))
+
+class EncodingTest(unittest.TestCase):
+
+    def test_choose_encoding(self):
+        choose = gameforge_metrics.choose_encoding
+        self.assertEqual(choose(None), 'identity')
+        self.assertEqual(choose('br, deflate'), 'identity')
+        self.assertEqual(choose('gzip'), 'gzip')
+        self.assertEqual(choose('GZIP;q=0.5, identity;q=0.4'), 'gzip')
+        self.assertEqual(choose('gzip;q=0, identity'), 'identity')
+        self.assertEqual(choose('gzip;q=bad'), 'identity')
+        if 'zstd' in gameforge_metrics.COMPRESSORS:
+            # Equal weights go to the first coding in COMPRESSORS order
+            self.assertEqual(choose('gzip, zstd'), 'zstd')
+            self.assertEqual(choose('gzip;q=1, zstd;q=0.5'), 'gzip')
+
+    def test_compressed_bodies_are_cached_per_snapshot(self):
+        registry = CollectorRegistry()
+        Counter('test_encoded', 'Test', registry=registry).inc()
+        cache = gameforge_metrics.MetricsSnapshotCache(registry=registry, ttl=60)
+        plain, plain_headers = cache.get(accept_encoding='identity')
+        body, headers = cache.get(accept_encoding='gzip')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Encoding', plain_headers)
+        self.assertEqual(headers['Vary'], 'Accept, Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), plain)
+        self.assertIs(cache.get(accept_encoding='gzip')[0], body)
+
+    def test_openmetrics_negotiation(self):
+        registry = CollectorRegistry()
+        Counter('test_negotiated', 'Test', registry=registry).inc()
+        cache = gameforge_metrics.MetricsSnapshotCache(registry=registry, ttl=60)
+        body, headers = cache.get(accept='application/openmetrics-text; version=1.0.0')
+        self.assertTrue(headers['Content-Type'].startswith('application/openmetrics-text'))
+        self.assertTrue(body.endswith(b'# EOF\n'))
+        body, headers = cache.get(accept='text/plain')
+        self.assertTrue(headers['Content-Type'].startswith('text/plain'))
+        self.assertNotIn(b'# EOF', body)
+
+class GpuCollectionTest(unittest.TestCase):
+    """Snapshot, hot-plug and failure handling driven through FakeGpuBackend"""
+
+    def setUp(self):
+        self._previous = metrics.gpu_backend
+        self.backend = FakeGpuBackend(device_count=2)
+        metrics.set_gpu_backend(self.backend)
+
+    def tearDown(self):
+        metrics.set_gpu_backend(self._previous)
+
+    def test_snapshot_reads_every_device(self):
+        snapshot = metrics.gpu_snapshot(max_age=0)
+        self.assertEqual([reading.index for reading in snapshot.readings], [0, 1])
+        self.assertEqual(sorted(snapshot.as_dict()), ['gpu_0', 'gpu_1'])
+        self.assertEqual(snapshot.readings[1].temperature, 61.0)
+
+    def test_snapshot_is_shared_within_ttl(self):
+        first = metrics.gpu_snapshot(max_age=60)
+        self.assertIs(metrics.gpu_snapshot(max_age=60), first)
+
+    def test_hot_plug_rediscovers_devices(self):
+        metrics.gpu_snapshot(max_age=0)
+        self.backend.set_device_count(3)
+        self.assertEqual(len(metrics.gpu_snapshot(max_age=0).readings), 3)
+        self.assertEqual(metrics.gpu_count, 3)
+        self.backend.set_device_count(1)
+        self.assertEqual(len(metrics.gpu_snapshot(max_age=0).readings), 1)
+
+    def test_failed_device_is_skipped_then_recovers(self):
+        metrics.gpu_snapshot(max_age=0)
+        self.backend.fail_next(1)
+        self.assertEqual([r.index for r in metrics.gpu_snapshot(max_age=0).readings], [0])
+        self.assertEqual([r.index for r in metrics.gpu_snapshot(max_age=0).readings], [0, 1])
+
+    def test_sample_window_survives_polling(self):
+        sampling = metrics.gpu_sampling
+        metrics.gpu_sampling = True
+        try:
+            metrics.gpu_snapshot(max_age=0)
+            metrics._consume_gpu_windows()
+            time.sleep(0.4)
+            metrics.gpu_snapshot(max_age=0)
+            metrics.gpu_snapshot(max_age=0)  # a /metrics/gpu poll with no new samples
+            windows = metrics._consume_gpu_windows()
+            self.assertEqual(sorted(labels[0] for labels in windows), ['0', '1'])
+            low, average, high, p95 = windows[('0', self.backend.model_name)]
+            self.assertTrue(low <= average <= high and low <= p95 <= high)
+            self.assertEqual(metrics._consume_gpu_windows(), {})
+        finally:
+            metrics.gpu_sampling = sampling
+
+    def test_null_backend_reports_no_devices(self):
+        metrics.set_gpu_backend(gameforge_metrics.create_gpu_backend('none'))
+        self.assertIsInstance(metrics.gpu_backend, NullGpuBackend)
+        self.assertEqual(metrics.gpu_snapshot(max_age=0).readings, ())
+        self.assertFalse(metrics.gpu_available)
+
+    def test_backend_interface_is_abstract(self):
+        with self.assertRaises(TypeError):
+            GpuBackend()
+
+class ShardedCounterTest(unittest.TestCase):
+
+    def test_merges_shards_of_live_and_finished_threads(self):
+        counter = ShardedCounter('test_requests_total', 'Test', ['method'], registry=None)
+
+        def work():
+            child = counter.labels('GET')
+            for _ in range(1000):
+                child.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.labels('POST').inc(2.5)
+        families = counter.collect()
+        self.assertEqual(_sample(families, 'test_requests_total', {'method': 'GET'}), 8000)
+        self.assertEqual(_sample(families, 'test_requests_total', {'method': 'POST'}), 2.5)
+        # Finished threads are folded into the retired totals exactly once
+        self.assertEqual(len(counter._shards), 1)
+        self.assertEqual(_sample(counter.collect(), 'test_requests_total', {'method': 'GET'}), 8000)
+
+    def test_rejects_negative_increments(self):
+        counter = ShardedCounter('test_negative_total', 'Test', registry=None)
+        with self.assertRaises(ValueError):
+            counter.inc(-1)
+
+class MetricUpdateBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.applied = []
+        registry = CollectorRegistry()
+        self.dropped = Counter('test_dropped', 'Test', registry=registry)
+        self.dropped_total = lambda: registry.get_sample_value('test_dropped_total')
+
+    def buffer(self, overflow, maxsize=2):
+        return gameforge_metrics.MetricUpdateBuffer(
+            lambda *update: self.applied.append(update), maxsize=maxsize,
+            overflow=overflow, dropped=self.dropped)
+
+    def test_flush_merges_counters_and_keeps_last_gauge(self):
+        buffer = self.buffer('drop_newest', maxsize=10)
+        buffer.append('http_requests_total', ('GET',))
+        buffer.append('http_requests_total', ('GET',), 2)
+        buffer.append('worker_queue_size', ('q',), 5)
+        buffer.append('worker_queue_size', ('q',), 3)
+        buffer.flush()
+        self.assertEqual(sorted(self.applied),
+                         [('http_requests_total', ('GET',), 3), ('worker_queue_size', ('q',), 3)])
+        self.assertEqual(len(buffer), 0)
+
+    def test_drop_newest(self):
+        buffer = self.buffer('drop_newest')
+        for value in (1, 2, 3):
+            buffer.append('a', (str(value),), value)
+        buffer.flush()
+        self.assertEqual([update[2] for update in self.applied], [1, 2])
+        self.assertEqual(self.dropped_total(), 1)
+
+    def test_drop_oldest(self):
+        buffer = self.buffer('drop_oldest')
+        for value in (1, 2, 3):
+            buffer.append('a', (str(value),), value)
+        buffer.flush()
+        self.assertEqual([update[2] for update in self.applied], [2, 3])
+        self.assertEqual(self.dropped_total(), 1)
+
+    def test_inline_flushes_on_the_caller(self):
+        buffer = self.buffer('inline')
+        for value in (1, 2, 3):
+            buffer.append('a', (str(value),), value)
+        self.assertEqual([update[2] for update in self.applied], [1, 2])
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(self.dropped_total(), 0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self.buffer('block')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_child_gets_its_own_flusher(self):
+        buffer = self.buffer('drop_newest', maxsize=100)
+        buffer.start_flusher(interval=0.02)
+        buffer.append('a', ('parent',))
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.applied.clear()  # the parent's flusher may have run before the fork
+                buffer.append('a', ('child',))
+                time.sleep(0.3)
+                os.write(write_end, repr(self.applied).encode())
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_end) as pipe:
+            child_applied = pipe.read()
+        # The child applies its own update and never the parent's queued one
+        self.assertEqual(child_applied, repr([('a', ('child',), 1)]))
+
+class CardinalityLimiterTest(unittest.TestCase):
+
+    def test_normalize_endpoint(self):
+        self.assertEqual(
+            normalize_endpoint('/assets/123e4567-e89b-12d3-a456-426614174000/v2/17?x=1'),
+            '/assets/:uuid/v2/:id')
+        self.assertEqual(normalize_endpoint('/blobs/0123456789abcdef0123'), '/blobs/:hash')
+
+    def test_overflow_series_and_rejected_count(self):
+        registry = CollectorRegistry()
+        rejected = Counter('test_rejected', 'Test', registry=registry)
+        limiter = CardinalityLimiter('test', ['endpoint', 'status'], 'endpoint', max_series=2,
+                                     normalize=normalize_endpoint, rejected=rejected)
+        self.assertEqual(limiter.admit(('/a/1', 200)), ('/a/:id', '200'))
+        self.assertEqual(limiter.admit(('/a/2', 200)), ('/a/:id', '200'))
+        self.assertEqual(limiter.admit(('/b', 200)), ('/b', '200'))
+        self.assertEqual(limiter.admit(('/c', 200)), (OVERFLOW_LABEL_VALUE, '200'))
+        self.assertEqual(limiter.admit(('/b', 200)), ('/b', '200'))
+        self.assertEqual(registry.get_sample_value('test_rejected_total'), 1)
+        limiter.release(('/b', '200'))
+        self.assertEqual(limiter.admit(('/c', 200)), ('/c', '200'))
+
+class BindTest(unittest.TestCase):
+
+    def test_bound_child_is_the_cached_series(self):
+        bound = metrics.bind('http_requests_total', method='GET', endpoint='/bind-test', status=200)
+        self.assertIs(bound, metrics.bind('http_requests_total', status=200, endpoint='/bind-test', method='GET'))
+        bound.inc()
+        metrics.record_http_request('GET', '/bind-test', 200)
+        self.assertEqual(gameforge_metrics.REGISTRY.get_sample_value(
+            'gameforge_http_requests_total',
+            {'method': 'GET', 'endpoint': '/bind-test', 'status': '200'}), 2)
+
+    def test_rejects_unknown_metric_or_labels(self):
+        with self.assertRaises(ValueError):
+            metrics.bind('no_such_metric', model='m')
+        with self.assertRaises(ValueError):
+            metrics.bind('http_requests_total', method='GET', endpoint='/bind-test')
+        with self.assertRaises(ValueError):
+            metrics.bind('inference_requests_total', model='m', status='success', extra='x')
+
+class LabelCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        self.counter = Counter('test_events', 'Test', ['kind'], registry=self.registry)
+
+    def value(self, kind):
+        return self.registry.get_sample_value('test_events_total', {'kind': kind})
+
+    def test_caches_children(self):
+        cache = LabelCache(self.counter)
+        self.assertIs(cache.get('a'), cache.get('a'))
+        cache.get('a').inc()
+        self.assertEqual(self.value('a'), 1)
+
+    def test_idle_series_are_evicted_and_reattached(self):
+        evicted = []
+        cache = LabelCache(self.counter, idle_ttl=60, on_evict=evicted.append)
+        held = cache.get('a')
+        held.inc()
+        cache.get('b').inc()
+        self.assertEqual(cache.evict_idle(), 0)
+        self.assertEqual(cache.evict_idle(now=time.monotonic() + 120), 2)
+        self.assertEqual(sorted(evicted), [('a',), ('b',)])
+        self.assertIsNone(self.value('a'))
+        # A child handed out before eviction re-creates its series on the next update
+        held.inc(2)
+        self.assertEqual(self.value('a'), 2)
+        cache.get('a').inc()
+        self.assertEqual(self.value('a'), 3)
+        self.assertIsNone(self.value('b'))
+
+    def test_eviction_frees_limiter_slots(self):
+        limiter = CardinalityLimiter('test_events', ['kind'], 'kind', max_series=1)
+        cache = LabelCache(self.counter, limiter=limiter, idle_ttl=60)
+        cache.get('a').inc()
+        cache.get('b').inc()
+        self.assertEqual(self.value(OVERFLOW_LABEL_VALUE), 1)
+        cache.evict_idle(now=time.monotonic() + 120)
+        self.assertEqual(len(limiter), 0)
+        cache.get('c').inc()
+        self.assertEqual(self.value('c'), 1)
+
+    def test_update_racing_eviction_keeps_series(self):
+        cache = LabelCache(self.counter, idle_ttl=60)
+        cache.get('a').inc()
+        tracked = cache._tracked[('a',)]
+        stale = tracked.last_update
+        # The series looks idle at the check, then an update stamps it before removal
+        racing = cache._tracked[('a',)] = _RacingChild(tracked._child, [stale, stale + 120])
+        self.assertEqual(cache.evict_idle(now=stale + 120), 0)
+        self.assertIs(racing._child, tracked._child)
+        self.assertEqual(self.value('a'), 1)
+
+class _RacingChild(gameforge_metrics._TrackedChild):
+    """Tracked child reporting successive last_update stamps, one per read"""
+
+    __slots__ = ('_stamps',)
+
+    def __init__(self, child, stamps):
+        self._child = child
+        self._stamps = list(stamps)
+
+    @property
+    def last_update(self):
+        return self._stamps.pop(0) if len(self._stamps) > 1 else self._stamps[0]
+
+    @last_update.setter
+    def last_update(self, value):
+        self._stamps = [value]
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.lognormvariate(-3, 1.5) for _ in range(20000)]
+
+    def test_quantiles_within_relative_accuracy(self):
+        sketch = QuantileSketch(accuracy=0.01)
+        for value in self.values:
+            sketch.observe(value)
+        ordered = sorted(self.values)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact) / exact, 0.0101)
+        self.assertEqual(sketch.count, len(self.values))
+        self.assertAlmostEqual(sketch.sum, sum(self.values))
+
+    def test_merge_matches_single_sketch(self):
+        whole, left, right = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for i, value in enumerate(self.values):
+            whole.observe(value)
+            (left if i % 2 else right).observe(value)
+        left.merge(right)
+        self.assertEqual(left.count, whole.count)
+        for q in (0.5, 0.99):
+            self.assertEqual(left.quantile(q), whole.quantile(q))
+
+    def test_collapse_bounds_bins_and_keeps_upper_quantiles(self):
+        sketch = QuantileSketch(accuracy=0.01, max_bins=256)
+        for value in self.values:
+            sketch.observe(value)
+        self.assertLessEqual(len(sketch._bins), 256)
+        exact = sorted(self.values)[int(0.99 * (len(self.values) - 1))]
+        self.assertLessEqual(abs(sketch.quantile(0.99) - exact) / exact, 0.0101)
+
+    def test_empty_and_zero_values(self):
+        sketch = QuantileSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        sketch.observe(0.0)
+        sketch.observe(2.0)
+        self.assertEqual(sketch.quantile(0.0), 0.0)
+        self.assertEqual(sketch.count_above(1.0), 1)
+
+class WindowedSketchTest(unittest.TestCase):
+
+    def test_windows_match_brute_force(self):
+        rng = random.Random(3)
+        windowed = WindowedSketch()
+        observed = []
+        now = 1000.0
+        for step in range(6000):
+            now += rng.expovariate(2.0) if rng.random() < 0.99 else rng.uniform(30, 900)
+            value = rng.lognormvariate(-3, 1)
+            windowed.observe(value, now)
+            observed.append((now, value))
+            if step % 250 == 0:
+                for _, seconds in gameforge_metrics.SLO_WINDOWS:
+                    first = math.ceil((now - seconds) / windowed.slot_seconds)
+                    expected = [v for t, v in observed if t // windowed.slot_seconds >= first]
+                    sketch = windowed.window(seconds, now)
+                    self.assertEqual(sketch.count, len(expected))
+                    self.assertAlmostEqual(sketch.sum, sum(expected))
+
+    def test_old_slots_leave_the_window(self):
+        windowed = WindowedSketch()
+        windowed.observe(0.1, now=0.0)
+        windowed.observe(0.2, now=100.0)
+        self.assertEqual(windowed.window(60, now=100.0).count, 1)
+        self.assertEqual(windowed.window(300, now=100.0).count, 2)
+        self.assertEqual(windowed.window(3600, now=4000.0).count, 0)
+
+class InferenceSLOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.slo = gameforge_metrics.InferenceSLOCollector(registry=None)
+        self.observed = []
+
+    def observer(self, model):
+        child = type('Child', (), {'observe': lambda _, amount, exemplar=None: self.observed.append(amount)})()
+        return self.slo.tee(lambda key: child)((model, 'success'))
+
+    def test_quantiles_and_burn_rate(self):
+        observer = self.observer('slo-model')
+        for _ in range(98):
+            observer.observe(0.05)
+        observer.observe(1.0)
+        observer.observe(2.0)
+        self.assertEqual(len(self.observed), 100)
+        self.slo.set_target('slo-model', 0.5, objective=0.99)
+        stats = self.slo.as_dict()['slo-model']['windows']['1m']
+        self.assertEqual(stats['count'], 100)
+        self.assertAlmostEqual(stats['p50'], 0.05, delta=0.05 * 0.011)
+        # 2% of calls were slow against a 1% budget
+        self.assertAlmostEqual(stats['burn_rate'], 2.0)
+
+    def test_idle_models_are_pruned_and_come_back(self):
+        observer = self.observer('pruned-model')
+        observer.observe(0.1)
+        self.assertIn('pruned-model', self.slo.summary())
+        self.assertEqual(self.slo.summary(now=time.monotonic() + 3700), {})
+        self.assertEqual(self.slo._windows, {})
+        # A child cached before pruning feeds the model's new window
+        observer.observe(0.2)
+        self.assertEqual(self.slo.summary()['pruned-model']['1m'].count, 1)
+
+class ExponentialHistogramTest(unittest.TestCase):
+
+    def test_bucket_boundaries(self):
+        histogram = ExponentialHistogram(schema=0)
+        for value in (1.0, 2.0, 2.0, 3.0, 4.0, 8.0):
+            histogram.observe(value)
+        # Bucket i covers (2**(i-1), 2**i]
+        self.assertEqual(histogram._buckets, {0: 1, 1: 2, 2: 2, 3: 1})
+
+    def test_native_spans_and_deltas(self):
+        histogram = ExponentialHistogram(schema=0)
+        for value in (1.0, 2.0, 2.0, 8.0, 0.0):
+            histogram.observe(value)
+        native = histogram.native()
+        self.assertEqual(native.count_value, 5)
+        self.assertEqual(native.zero_count, 1)
+        self.assertEqual([(span.offset, span.length) for span in native.pos_spans], [(0, 2), (1, 1)])
+        self.assertEqual(list(native.pos_deltas), [1, 1, -1])
+
+    def test_downscale_keeps_counts(self):
+        histogram = ExponentialHistogram(schema=3, max_buckets=8)
+        rng = random.Random(5)
+        for _ in range(5000):
+            histogram.observe(rng.lognormvariate(0, 3))
+        self.assertLess(histogram.schema, 3)
+        self.assertLessEqual(len(histogram._buckets), 8)
+        self.assertEqual(sum(histogram._buckets.values()) + histogram.zero_count, 5000)
+
+class SharedMemorySegmentTest(unittest.TestCase):
+    """One segment and writer for the whole class; series are kept apart by label"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.layout = SharedLayout.from_metrics(metrics)
+        cls.segment = SharedMetricsSegment.open(
+            f'gfm_test_{os.getpid()}', cls.layout, worker_slots=4, series_slots=32)
+        cls.writer = cls.segment.writer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.segment.close()
+        cls.segment.unlink()
+
+    def labels(self, attr, value):
+        labelnames = self.layout.entries[SHARED_METRICS.index(attr)][3]
+        return (value,) + ('x',) * (len(labelnames) - 1)
+
+    def series(self, attr, labels):
+        return self.segment.read().get(SHARED_METRICS.index(attr), {}).get(labels)
+
+    def test_values_are_8_byte_aligned(self):
+        self.assertEqual(gameforge_metrics._SHM_HEADER.size % 8, 0)
+        self.assertEqual(self.segment.slot_size % 8, 0)
+        self.writer.child('http_requests_total', self.labels('http_requests_total', 'align')).inc()
+        for index in range(self.segment.series_slots):
+            self.assertEqual(self.segment._value_offset(self.writer._offset, index) % 8, 0)
+
+    def test_counter_and_histogram_round_trip(self):
+        labels = self.labels('http_requests_total', 'roundtrip')
+        self.writer.child('http_requests_total', labels).inc(3)
+        self.writer.child('http_requests_total', labels).inc()
+        self.assertEqual(self.series('http_requests_total', labels)[0], 4)
+        labels = self.labels('inference_duration', 'roundtrip')
+        histogram = self.writer.child('inference_duration', labels)
+        for value in (0.001, 0.2, 100.0):
+            histogram.observe(value)
+        # Bucket counts then the sum, padded to the widest metric in the layout
+        buckets = len(self.layout.entries[SHARED_METRICS.index('inference_duration')][4])
+        values = self.series('inference_duration', labels)
+        self.assertEqual(sum(values[:buckets]), 3)
+        self.assertEqual(values[buckets - 1], 1)  # 100s lands in +Inf
+        self.assertAlmostEqual(values[buckets], 100.201)
+
+    def test_gauges_store_value_and_merge_by_mode(self):
+        labels = self.labels('worker_queue_size', 'gauge')
+        gauge = self.writer.child('worker_queue_size', labels)
+        gauge.set(5)
+        gauge.inc(2)
+        gauge.dec()
+        self.assertEqual(self.series('worker_queue_size', labels)[0], 6)
+        merge = gameforge_metrics._merge_gauge
+        self.assertEqual(merge('livesum', [1.0, 10.0], [2.0, 5.0]), [3.0, 10.0])
+        self.assertEqual(merge('livemax', [1.0, 10.0], [2.0, 5.0]), [2.0, 5.0])
+        self.assertEqual(merge('min', [1.0, 10.0], [2.0, 5.0]), [1.0, 10.0])
+        self.assertEqual(merge('mostrecent', [1.0, 10.0], [2.0, 5.0]), [1.0, 10.0])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_worker_claims_its_own_region(self):
+        labels = self.labels('http_requests_total', 'fork')
+        child = self.writer.child('http_requests_total', labels)
+        child.inc()
+        parent_slot = self.writer.slot
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child.inc(5)
+                os._exit(0 if self.writer.slot != parent_slot else 1)
+            finally:
+                os._exit(2)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(self.writer.slot, parent_slot)
+        self.assertEqual(self.series('http_requests_total', labels)[0], 6)
+        self.assertIn(pid, self.segment.owners())
+
+    def test_segment_outlives_the_process_that_created_it(self):
+        name = f'gfm_test_creator_{os.getpid()}'
+        creator = (
+            'import gameforge_metrics as g\n'
+            f'segment = g.SharedMetricsSegment.open({name!r}, g.SharedLayout.from_metrics(g.metrics), 4, 32)\n'
+            "segment.writer().child('http_requests_total', ('GET', '/created', '200')).inc()\n"
+        )
+        env = dict(os.environ, GAMEFORGE_GPU_BACKEND='fake')
+        subprocess.run([sys.executable, '-c', creator], check=True, env=env,
+                       cwd=os.path.dirname(os.path.abspath(gameforge_metrics.__file__)))
+        try:
+            segment = SharedMetricsSegment.open(name, self.layout, worker_slots=4, series_slots=32)
+            self.assertEqual(segment.read()[SHARED_METRICS.index('http_requests_total')],
+                             {('GET', '/created', '200'): [1.0] + [0.0] * (segment.value_slots - 1)})
+            segment.close()
+        finally:
+            gameforge_metrics.unlink_shared_segment(name)
+        with self.assertRaises(FileNotFoundError):
+            gameforge_metrics._untracked_shared_memory(name)
+
+class AsyncDecoratorTest(unittest.TestCase):
+
+    def _requests(self, model, status):
+        return gameforge_metrics.REGISTRY.get_sample_value(
+            'gameforge_inference_requests_total', {'model': model, 'status': status}) or 0
+
+    def _duration_count(self, model):
+        return gameforge_metrics.REGISTRY.get_sample_value(
+            'gameforge_inference_request_duration_seconds_count', {'model': model}) or 0
+
+    def test_coroutine_is_timed_until_it_finishes(self):
+        @metrics.time_inference('async-model')
+        async def generate(fail):
+            await asyncio.sleep(0.02)
+            if fail:
+                raise RuntimeError('boom')
+            return 'ok'
+
+        self.assertTrue(asyncio.iscoroutinefunction(generate))
+        self.assertEqual(asyncio.run(generate(False)), 'ok')
+        with self.assertRaises(RuntimeError):
+            asyncio.run(generate(True))
+        self.assertEqual(self._requests('async-model', 'success'), 1)
+        self.assertEqual(self._requests('async-model', 'error'), 1)
+        self.assertEqual(self._duration_count('async-model'), 2)
+        # Both calls awaited 20ms, so neither lands in the 10ms bucket
+        self.assertEqual(gameforge_metrics.REGISTRY.get_sample_value(
+            'gameforge_inference_request_duration_seconds_bucket',
+            {'model': 'async-model', 'le': '0.01'}), 0)
+
+    def test_async_generator_is_timed_over_its_whole_run(self):
+        @metrics.time_inference('async-gen-model')
+        async def produce():
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield i
+
+        async def consume():
+            return [item async for item in produce()]
+
+        self.assertEqual(asyncio.run(consume()), [0, 1, 2])
+        self.assertEqual(self._requests('async-gen-model', 'success'), 1)
+        self.assertEqual(self._duration_count('async-gen-model'), 1)
+
+    def test_async_stage_records_its_span(self):
+        @metrics.time_stage('decode', 'async-stage-model')
+        async def decode():
+            await asyncio.sleep(0)
+            return gameforge_metrics._current_span.get().stage
+
+        self.assertEqual(asyncio.run(decode()), 'decode')
+        self.assertEqual(gameforge_metrics.REGISTRY.get_sample_value(
+            'gameforge_inference_stage_duration_seconds_count',
+            {'model': 'async-stage-model', 'stage': 'decode'}), 1)
+
+
+class InstrumentStreamTest(unittest.TestCase):
+
+    def _value(self, name, model, **labels):
+        return gameforge_metrics.REGISTRY.get_sample_value(name, dict(labels, model=model)) or 0
+
+    def _assert_stream_recorded(self, model, chunks):
+        self.assertEqual(self._value('gameforge_inference_time_to_first_chunk_seconds_count', model), 1)
+        self.assertEqual(self._value('gameforge_inference_inter_chunk_seconds_count', model), chunks - 1)
+        self.assertEqual(self._value('gameforge_inference_stream_chunks_sum', model), chunks)
+        self.assertEqual(self._value('gameforge_inference_requests_total', model, status='success'), 1)
+        self.assertEqual(self._value('gameforge_inference_request_duration_seconds_count', model), 1)
+
+    def test_sync_stream(self):
+        def produce():
+            for i in range(4):
+                time.sleep(0.002)
+                yield i
+
+        self.assertEqual(list(metrics.instrument_stream('stream-sync', produce())), [0, 1, 2, 3])
+        self._assert_stream_recorded('stream-sync', 4)
+        # Every chunk took at least 2ms, so none was faster than the 1ms bucket
+        self.assertEqual(self._value(
+            'gameforge_inference_inter_chunk_seconds_bucket', 'stream-sync', le='0.001'), 0)
+
+    def test_async_stream(self):
+        @metrics.time_stream('stream-async')
+        async def produce():
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield i
+
+        async def consume():
+            return [item async for item in produce()]
+
+        self.assertEqual(asyncio.run(consume()), [0, 1, 2])
+        self._assert_stream_recorded('stream-async', 3)
+
+    def test_failed_stream_is_an_error(self):
+        def produce():
+            yield 'partial'
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            list(metrics.instrument_stream('stream-error', produce()))
+        self.assertEqual(self._value('gameforge_inference_requests_total', 'stream-error', status='error'), 1)
+        self.assertEqual(self._value('gameforge_inference_stream_chunks_sum', 'stream-error'), 1)
+
+    def test_abandoned_stream_closes_the_source(self):
+        closed = []
+
+        def produce():
+            try:
+                yield from range(10)
+            finally:
+                closed.append(True)
+
+        stream = metrics.instrument_stream('stream-closed', produce())
+        next(stream)
+        stream.close()
+        self.assertEqual(closed, [True])
+        self.assertEqual(self._value('gameforge_inference_stream_chunks_sum', 'stream-closed'), 1)
+
+
+class SpanTest(unittest.TestCase):
+
+    def setUp(self):
+        self._sample_rate = metrics.trace_sample_rate
+        metrics.trace_sample_rate = 1.0
+
+    def tearDown(self):
+        metrics.trace_sample_rate = self._sample_rate
+
+    def test_nested_spans_share_model_and_trace(self):
+        with metrics.span('request', 'span-model') as outer:
+            with metrics.span('gpu') as inner:
+                self.assertEqual(inner.model, 'span-model')
+                self.assertEqual(inner.trace_id, outer.trace_id)
+        self.assertIsNone(gameforge_metrics._current_span.get())
+        trace = metrics._traces[-1]
+        self.assertEqual(trace.trace_id, outer.trace_id)
+        self.assertEqual([span[0] for span in trace.spans], ['gpu', 'request'])
+        count = gameforge_metrics.REGISTRY.get_sample_value(
+            'gameforge_inference_stage_duration_seconds_count',
+            {'model': 'span-model', 'stage': 'gpu'})
+        self.assertEqual(count, 1)
+
+    def test_generator_span_stays_out_of_the_consumer(self):
+        @metrics.time_stage('produce', 'producer')
+        def produce():
+            for _ in range(3):
+                yield gameforge_metrics._current_span.get().model
+
+        with metrics.span('consume', 'consumer'):
+            for model in produce():
+                self.assertEqual(model, 'producer')
+                with metrics.span('handle') as handle:
+                    self.assertEqual(handle.model, 'consumer')
+        self.assertIsNone(gameforge_metrics._current_span.get())
+
+    def test_async_generator_span_stays_out_of_the_consumer(self):
+        @metrics.time_stage('produce', 'async-producer')
+        async def produce():
+            for _ in range(3):
+                await asyncio.sleep(0)
+                yield gameforge_metrics._current_span.get().model
+
+        async def consume():
+            models = []
+            async with metrics.span('consume', 'async-consumer'):
+                async for model in produce():
+                    models.append(model)
+                    self.assertEqual(gameforge_metrics._current_span.get().model, 'async-consumer')
+            return models
+
+        self.assertEqual(asyncio.run(consume()), ['async-producer'] * 3)
+
+class ExemplarTest(unittest.TestCase):
+
+    OPENMETRICS = 'application/openmetrics-text; version=1.0.0'
+
+    def _scrape(self):
+        cache = gameforge_metrics.MetricsSnapshotCache(ttl=0)
+        return cache.get(accept=self.OPENMETRICS)[0].decode()
+
+    def _line(self, body, prefix):
+        return next(line for line in body.splitlines() if line.startswith(prefix))
+
+    def test_http_counter_carries_the_request_id(self):
+        metrics.record_http_request('GET', '/exemplar-explicit', 200, trace_id='explicit-id')
+        with metrics.request_context('context-id'):
+            metrics.record_http_request('GET', '/exemplar-context', 200)
+        body = self._scrape()
+        self.assertIn('# {trace_id="explicit-id"} 1.0', self._line(
+            body, 'gameforge_http_requests_total{endpoint="/exemplar-explicit"'))
+        self.assertIn('# {trace_id="context-id"} 1.0', self._line(
+            body, 'gameforge_http_requests_total{endpoint="/exemplar-context"'))
+        self.assertIsNone(gameforge_metrics.current_trace_id())
+
+    def test_duration_bucket_carries_the_span_trace_id(self):
+        sample_rate = metrics.trace_sample_rate
+        metrics.trace_sample_rate = 1.0
+        try:
+            with metrics.span('request', 'exemplar-model') as span:
+                self.assertEqual(gameforge_metrics.current_trace_id(), span.trace_id)
+                with metrics.inference_timer('exemplar-model'):
+                    pass
+        finally:
+            metrics.trace_sample_rate = sample_rate
+        bucket = self._line(self._scrape(),
+                            'gameforge_inference_request_duration_seconds_bucket{le="0.01",model="exemplar-model"}')
+        self.assertIn(f'# {{trace_id="{span.trace_id}"}}', bucket)
+
+    def test_ids_are_truncated_and_can_be_disabled(self):
+        self.assertEqual(gameforge_metrics._exemplar('x' * 100),
+                         {'trace_id': 'x' * gameforge_metrics.EXEMPLAR_ID_LENGTH})
+        self.assertIsNone(gameforge_metrics._exemplar(None))
+        enabled = gameforge_metrics.EXEMPLARS
+        gameforge_metrics.EXEMPLARS = False
+        try:
+            self.assertIsNone(gameforge_metrics._exemplar('id'))
+        finally:
+            gameforge_metrics.EXEMPLARS = enabled
+
+
+class CacheRatioTest(unittest.TestCase):
+
+    def test_ratios_by_lookup_and_byte(self):
+        ratios = gameforge_metrics.CacheRatioCollector(window=60, slot_seconds=10, registry=None)
+        now = time.monotonic()
+        ratios.record('m', True, 300, now=now)
+        ratios.record('m', True, 100, now=now)
+        ratios.record('m', False, 600, now=now)
+        ratio, byte_ratio = ratios.collect()
+        self.assertAlmostEqual(_sample([ratio], ratio.name, {'model': 'm'}), 2 / 3)
+        self.assertAlmostEqual(_sample([byte_ratio], byte_ratio.name, {'model': 'm'}), 0.4)
+        self.assertEqual(ratios.totals(now=now + 100), {})
+
+    def test_bytes_without_lookups_in_window(self):
+        ratios = gameforge_metrics.CacheRatioCollector(window=60, slot_seconds=10, registry=None)
+        # The lookup and its bytes land in different slots; the lookup's slot ages out first
+        now = time.monotonic()
+        ratios.record('m', True, lookups=1, now=now - 61)
+        ratios.record('m', True, 100, lookups=0, now=now)
+        self.assertEqual(ratios.totals(now=now), {'m': (0, 0, 100, 0)})
+        ratio, byte_ratio = ratios.collect()
+        self.assertIsNone(_sample([ratio], ratio.name))
+        self.assertEqual(_sample([byte_ratio], byte_ratio.name, {'model': 'm'}), 1.0)
+
+    def test_bound_byte_counter_alone_renders(self):
+        metrics.bind('model_cache_served_bytes', model='bytes-only').inc(100)
+        body = gameforge_metrics.metrics_cache.get(accept='text/plain')[0]
+        self.assertIn(b'gameforge_model_cache_byte_hit_ratio{model="bytes-only"} 1.0', body)
+        self.assertNotIn(b'gameforge_model_cache_hit_ratio{model="bytes-only"}', body)
+
+class CacheFetchTest(unittest.TestCase):
+
+    def value(self, name, **labels):
+        return gameforge_metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_hit_records_served_bytes_and_cache_duration(self):
+        with metrics.cache_fetch('fetch-hit') as fetch:
+            fetch.hit(512)
+        self.assertEqual(self.value('gameforge_model_cache_hits_total', model='fetch-hit'), 1)
+        self.assertEqual(self.value('gameforge_model_cache_served_bytes_total', model='fetch-hit'), 512)
+        self.assertEqual(self.value('gameforge_model_fetch_duration_seconds_count',
+                                    model='fetch-hit', source='cache'), 1)
+        self.assertEqual(metrics.cache_ratios.totals()['fetch-hit'], (1, 0, 512, 0))
+
+    def test_unmarked_failing_fetch_is_a_failed_download(self):
+        with self.assertRaises(OSError):
+            with metrics.cache_fetch('fetch-miss'):
+                raise OSError('network down')
+        self.assertEqual(self.value('gameforge_model_cache_misses_total', model='fetch-miss'), 1)
+        self.assertEqual(self.value('gameforge_model_download_total', model='fetch-miss', status='error'), 1)
+        self.assertEqual(self.value('gameforge_model_fetch_duration_seconds_count',
+                                    model='fetch-miss', source='download'), 1)
+
+    def test_async_fetch(self):
+        async def fetch_model():
+            async with metrics.cache_fetch('fetch-async') as fetch:
+                fetch.miss(2048)
+
+        asyncio.run(fetch_model())
+        self.assertEqual(self.value('gameforge_model_download_bytes_total', model='fetch-async'), 2048)
+        self.assertEqual(self.value('gameforge_model_download_total', model='fetch-async', status='success'), 1)
+
+if __name__ == '__main__':
+    unittest.main()